@@ -1,17 +1,20 @@
 import asyncio
 from pyrogram import filters
 from bot.config import app, OWNER_ID
-from bot.database import set_user_role, ban_user, update_setting, get_setting, get_all_users, get_user_count
+from bot.database import set_user_role, ban_user, update_setting, get_setting, iter_users, get_user_count, user_cache_stats
+from bot.force_sub import force_sub
 
 @app.on_message(filters.command("stats") & filters.private)
 async def stats(client, message):
     if str(message.from_user.id) != str(OWNER_ID): return
     
     total_users = await get_user_count()
+    cache = user_cache_stats()
     
     await message.reply(
         f"📊 **Bot Statistics**\n\n"
-        f"👥 Total Users: `{total_users}`"
+        f"👥 Total Users: `{total_users}`\n"
+        f"🗃️ User Cache: `{cache['size']}` cached, `{cache['hits']}` hits / `{cache['misses']}` misses"
     )
 
 @app.on_message(filters.command("killall") & filters.private)
@@ -97,6 +100,7 @@ async def set_force_sub(client, message):
     try:
         channel = message.text.split()[1]
         await update_setting("force_sub_channel", channel)
+        force_sub.reset()
         await message.reply(f"✅ Force Sub channel set to: {channel}")
     except:
         await message.reply("Usage: `/set_force_sub @channel`")
@@ -177,10 +181,12 @@ async def broadcast(client, message):
             await asyncio.sleep(0.05)
     else:
         # Broadcast to all users
-        users = await get_all_users()
-        total = len(users)
+        # Streamed in pages, so only the ids of one page are held at a time
+        total = await get_user_count()
+        index = 0
         
-        for index, row in enumerate(users):
+        async for row in iter_users():
+            index += 1
             try:
                 # Get the telegram_id and ensure it's an integer
                 tid = row.get('telegram_id')
@@ -193,9 +199,9 @@ async def broadcast(client, message):
                 print(f"[ERROR] Broadcast failed for {row.get('telegram_id')}: {e}")
             
             # Periodically update the progress message for transparency
-            if (index + 1) % 50 == 0:
+            if index % 50 == 0:
                 try:
-                    await msg.edit_text(f"🚀 Broadcasting...\nProgress: {index + 1}/{total}\nSent: {count}\nFailed: {blocked}")
+                    await msg.edit_text(f"🚀 Broadcasting...\nProgress: {index}/{total}\nSent: {count}\nFailed: {blocked}")
                 except Exception:
                     pass
             
@@ -214,8 +220,7 @@ async def list_premium_users(client, message):
         return
         
     try:
-        all_users = await get_all_users()
-        premium_users = [u for u in all_users if u.get("role") == "premium"]
+        premium_users = [u async for u in iter_users(("premium_expiry_date",), role="premium")]
         
         if not premium_users:
             await message.reply("No premium users found.")
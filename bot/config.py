@@ -21,6 +21,22 @@ OWNER_USERNAME = os.environ.get("OWNER_USERNAME", "OwnerUsername")
 SUPPORT_CHAT_LINK = os.environ.get("SUPPORT_CHAT_LINK", "https://t.me/Wolfy004chatbot")
 DATABASE_PATH = os.environ.get("DATABASE_PATH", "telegram_bot.db")
 
+# Background transfer queue: jobs running at once overall and per user, and jobs a user may queue
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", 6))
+MAX_JOBS_PER_USER = int(os.environ.get("MAX_JOBS_PER_USER", 1))
+MAX_QUEUED_PER_USER = int(os.environ.get("MAX_QUEUED_PER_USER", 20))
+
+# Most messages one range/list link may request, and items of a batch transferred at once
+MAX_BATCH_MESSAGES = int(os.environ.get("MAX_BATCH_MESSAGES", 500))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 3))
+
+# Connected user-session clients kept for reuse, and seconds an unused one stays connected
+USER_CLIENT_POOL_SIZE = int(os.environ.get("USER_CLIENT_POOL_SIZE", 4))
+USER_CLIENT_IDLE_TIMEOUT = int(os.environ.get("USER_CLIENT_IDLE_TIMEOUT", 600))
+
+# "relay" streams restricted media straight from download to upload, "disk" stages it in a file first
+TRANSFER_MODE = os.environ.get("TRANSFER_MODE", "relay").lower()
+
 # Optimization for 1.5GB RAM VPS and faster execution
 # Event loop is already initialized in main.py
 login_states = {}
@@ -41,6 +57,13 @@ RICHADS_WIDGET_ID = os.environ.get("RICHADS_WIDGET_ID", "351352")
 AD_DAILY_LIMIT = int(os.environ.get("AD_DAILY_LIMIT", 5))
 AD_FOR_PREMIUM = os.environ.get("AD_FOR_PREMIUM", "False").lower() == "true"
 
+# Media messages a user may receive per day (0 = unlimited); admins and the owner are never limited
+DAILY_TRANSFER_LIMIT = int(os.environ.get("DAILY_TRANSFER_LIMIT", 0))
+PREMIUM_DAILY_TRANSFER_LIMIT = int(os.environ.get("PREMIUM_DAILY_TRANSFER_LIMIT", 0))
+
+# Pyrogram's own save_file/get_file concurrency (fast_dl tunes its transfers adaptively)
+MAX_CONCURRENT_TRANSMISSIONS = int(os.environ.get("MAX_CONCURRENT_TRANSMISSIONS", 10))
+
 # Update client
 app = Client(
     "bot_session", 
@@ -48,6 +71,6 @@ app = Client(
     api_hash=API_HASH, 
     bot_token=BOT_TOKEN,
     in_memory=True,
-    max_concurrent_transmissions=10,
+    max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS,
     workers=10
 )
@@ -1,21 +1,59 @@
 import os
+import asyncio
 import sqlite3
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
-from threading import Lock
-from bot.config import OWNER_ID
+from typing import Optional, Dict
+from bot.config import OWNER_ID, DAILY_TRANSFER_LIMIT, PREMIUM_DAILY_TRANSFER_LIMIT
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 DATABASE_PATH = os.environ.get("DATABASE_PATH", "telegram_bot.db")
 
-db_lock = Lock()
+# Re-delivery cache: source file_unique_id -> file_id of our own upload
+MEDIA_CACHE_TTL_DAYS = int(os.environ.get("MEDIA_CACHE_TTL_DAYS", 30))
+MEDIA_CACHE_MAX_ENTRIES = int(os.environ.get("MEDIA_CACHE_MAX_ENTRIES", 50000))
+
+# User rows kept in memory (LRU); every user write updates the cached row too
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 5000))
+
+# Daily usage counters (ads, transfers, bytes) are kept in memory and written every
+# USAGE_FLUSH_INTERVAL seconds, so a crash loses at most that much usage
+USAGE_FLUSH_INTERVAL = int(os.environ.get("USAGE_FLUSH_INTERVAL", 10))
+
+# Rows fetched per query when iterating over all users
+USER_BATCH_SIZE = 500
+# Columns iter_users may project; telegram_id is always included as the pagination key
+USER_COLUMNS = ("telegram_id", "role", "is_agreed_terms", "premium_expiry_date",
+                "is_banned", "created_at", "updated_at")
+
+# Reader threads, each with its own connection; WAL lets them read while the writer commits
+DB_READERS = int(os.environ.get("DB_READERS", 3))
+# Prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+# All writes go through one connection on one thread, so they never contend for the write lock
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db_writer")
+_read_executor = ThreadPoolExecutor(max_workers=DB_READERS, thread_name_prefix="db_reader")
+_readers = threading.local()
+_writer = None
 _db_initialized = False
 
-def _get_connection():
-    conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, timeout=30.0)
+_user_cache = OrderedDict()  # telegram_id -> user dict, least recently used first
+_user_writes = 0  # Bumped by every user write, so a read that raced one is not cached
+_user_cache_hits = 0
+_user_cache_misses = 0
+
+_usage = {}  # (telegram_id, day) -> [ads, transfers, bytes]
+_usage_dirty = set()  # Keys of _usage changed since the last flush
+_reserved = {}  # telegram_id -> transfers held by queued or running jobs, not yet delivered
+
+def _connect():
+    conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, timeout=30.0, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA synchronous=NORMAL")
@@ -23,65 +61,301 @@ def _get_connection():
     conn.execute("PRAGMA temp_store=MEMORY")
     return conn
 
+def _writer_connection():
+    global _writer
+    if _writer is None:
+        _writer = _connect()
+    return _writer
+
+def _reader_connection():
+    conn = getattr(_readers, "conn", None)
+    if conn is None:
+        conn = _readers.conn = _connect()
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+async def _read(func, *args):
+    """Runs func(conn, *args) on a reader thread with that thread's connection."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _read_executor, lambda: func(_reader_connection(), *args)
+    )
+
+async def _transaction(func, *args):
+    """Runs func(conn, *args) on the writer thread as one transaction: committed on success, rolled back on error."""
+    def run():
+        conn = _writer_connection()
+        try:
+            result = func(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+    return await asyncio.get_running_loop().run_in_executor(_write_executor, run)
+
+async def _fetchone(sql, params=()):
+    return await _read(lambda conn: conn.execute(sql, params).fetchone())
+
+async def _fetchall(sql, params=()):
+    return await _read(lambda conn: conn.execute(sql, params).fetchall())
+
+async def _execute(sql, params=()):
+    return await _transaction(lambda conn: conn.execute(sql, params).rowcount)
+
+def _migrate_baseline(conn):
+    """Schema as it was before versioning; existing databases already have it."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            telegram_id TEXT PRIMARY KEY,
+            role TEXT DEFAULT 'free',
+            is_agreed_terms INTEGER DEFAULT 0,
+            phone_session_string TEXT,
+            premium_expiry_date TEXT,
+            is_banned INTEGER DEFAULT 0,
+            ads_today INTEGER DEFAULT 0,
+            last_ad_date TEXT,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            json_value TEXT,
+            updated_at TEXT
+        )
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS media_cache (
+            file_unique_id TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            hits INTEGER DEFAULT 0,
+            created_at TEXT,
+            last_used_at TEXT
+        )
+    ''')
+    
+    # Access hashes are only valid for the account that saw them, hence owner_id
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS peers (
+            owner_id INTEGER NOT NULL,
+            peer_id INTEGER NOT NULL,
+            access_hash INTEGER,
+            type TEXT NOT NULL,
+            username TEXT,
+            last_seen INTEGER,
+            PRIMARY KEY (owner_id, peer_id)
+        ) WITHOUT ROWID
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_usage (
+            telegram_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            ads INTEGER DEFAULT 0,
+            transfers INTEGER DEFAULT 0,
+            bytes INTEGER DEFAULT 0,
+            PRIMARY KEY (telegram_id, day)
+        ) WITHOUT ROWID
+    ''')
+    
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_banned ON users(is_banned)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_media_cache_last_used ON media_cache(last_used_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_peers_username ON peers(owner_id, username)')
+
+# Rows whose telegram_id is a plain integer; anything else cannot be a Telegram user
+_NUMERIC_ID = "CAST(CAST(telegram_id AS INTEGER) AS TEXT) = telegram_id"
+
+def _migrate_integer_keys(conn):
+    """
+    Integer user keys and sessions in their own table. users keys on an INTEGER PRIMARY KEY
+    (the rowid itself, so no separate index); tables keyed on text become WITHOUT ROWID.
+    ads_today / last_ad_date are dropped, daily_usage holds ad counts now.
+    """
+    conn.execute('''
+        CREATE TABLE users_new (
+            telegram_id INTEGER PRIMARY KEY,
+            role TEXT DEFAULT 'free',
+            is_agreed_terms INTEGER DEFAULT 0,
+            premium_expiry_date TEXT,
+            is_banned INTEGER DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+    conn.execute(f'''
+        INSERT OR IGNORE INTO users_new
+        SELECT CAST(telegram_id AS INTEGER), role, is_agreed_terms, premium_expiry_date,
+               is_banned, created_at, updated_at
+        FROM users WHERE {_NUMERIC_ID}
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE user_sessions (
+            telegram_id INTEGER PRIMARY KEY,
+            session_string TEXT NOT NULL,
+            updated_at TEXT
+        )
+    ''')
+    conn.execute(f'''
+        INSERT OR IGNORE INTO user_sessions
+        SELECT CAST(telegram_id AS INTEGER), phone_session_string, updated_at
+        FROM users WHERE {_NUMERIC_ID} AND COALESCE(phone_session_string, '') != ''
+    ''')
+    # Ad counts moved to daily_usage; carry over what the old columns hold for their day
+    conn.execute(f'''
+        INSERT INTO daily_usage (telegram_id, day, ads)
+        SELECT telegram_id, last_ad_date, ads_today FROM users
+        WHERE {_NUMERIC_ID} AND last_ad_date IS NOT NULL AND ads_today > 0
+        ON CONFLICT(telegram_id, day) DO UPDATE SET ads = MAX(ads, excluded.ads)
+    ''')
+    conn.execute('DROP TABLE users')
+    conn.execute('ALTER TABLE users_new RENAME TO users')
+    conn.execute('CREATE INDEX idx_users_role ON users(role)')
+    conn.execute('CREATE INDEX idx_users_banned ON users(is_banned)')
+    conn.execute('CREATE INDEX idx_users_premium_expiry ON users(premium_expiry_date)')
+    
+    conn.execute('''
+        CREATE TABLE daily_usage_new (
+            telegram_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            ads INTEGER DEFAULT 0,
+            transfers INTEGER DEFAULT 0,
+            bytes INTEGER DEFAULT 0,
+            PRIMARY KEY (telegram_id, day)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'''
+        INSERT OR IGNORE INTO daily_usage_new
+        SELECT CAST(telegram_id AS INTEGER), day, ads, transfers, bytes
+        FROM daily_usage WHERE {_NUMERIC_ID}
+    ''')
+    conn.execute('DROP TABLE daily_usage')
+    conn.execute('ALTER TABLE daily_usage_new RENAME TO daily_usage')
+    
+    conn.execute('''
+        CREATE TABLE settings_new (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            json_value TEXT,
+            updated_at TEXT
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('INSERT INTO settings_new SELECT key, value, json_value, updated_at FROM settings')
+    conn.execute('DROP TABLE settings')
+    conn.execute('ALTER TABLE settings_new RENAME TO settings')
+    
+    conn.execute('''
+        CREATE TABLE media_cache_new (
+            file_unique_id TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            hits INTEGER DEFAULT 0,
+            created_at TEXT,
+            last_used_at TEXT
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT INTO media_cache_new
+        SELECT file_unique_id, file_id, hits, created_at, last_used_at FROM media_cache
+    ''')
+    conn.execute('DROP TABLE media_cache')
+    conn.execute('ALTER TABLE media_cache_new RENAME TO media_cache')
+    conn.execute('CREATE INDEX idx_media_cache_last_used ON media_cache(last_used_at)')
+
+# Schema version N is reached by running MIGRATIONS[N - 1]; append new migrations, never edit old ones
+MIGRATIONS = [
+    _migrate_baseline,
+    _migrate_integer_keys,
+]
+
+def _migrate(conn):
+    """Brings the schema up to date; each migration and its version bump commit together."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version > len(MIGRATIONS):
+        raise RuntimeError(f"Database schema version {version} is newer than this code ({len(MIGRATIONS)})")
+    
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"Database migrated to schema version {number} ({migration.__name__})")
+    
+    if version < len(MIGRATIONS):
+        # Rebuilt tables leave free pages behind; give them back so backups shrink too
+        conn.execute('VACUUM')
+
 def init_db():
     global _db_initialized
     if _db_initialized:
         return
     
     try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    telegram_id TEXT PRIMARY KEY,
-                    role TEXT DEFAULT 'free',
-                    is_agreed_terms INTEGER DEFAULT 0,
-                    phone_session_string TEXT,
-                    premium_expiry_date TEXT,
-                    is_banned INTEGER DEFAULT 0,
-                    ads_today INTEGER DEFAULT 0,
-                    last_ad_date TEXT,
-                    created_at TEXT,
-                    updated_at TEXT
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT,
-                    json_value TEXT,
-                    updated_at TEXT
-                )
-            ''')
-            
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_banned ON users(is_banned)')
-            
-            conn.commit()
-            conn.close()
-            
+        # Runs once at startup, before the event loop serves anything
+        _migrate(_writer_connection())
+        
         _db_initialized = True
         logger.info(f"SQLite database initialized: {DATABASE_PATH}")
     except Exception as e:
         logger.error(f"SQLite initialization error: {e}")
         raise
 
+def _cache_user(key, user, writes_before):
+    if writes_before != _user_writes:
+        return
+    _user_cache[key] = dict(user)
+    _user_cache.move_to_end(key)
+    while len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
+
+def _update_cached_user(user_id, **fields):
+    """Write-through: applies a user write to the cached row, if the user is cached."""
+    global _user_writes
+    _user_writes += 1
+    user = _user_cache.get(int(user_id))
+    if user is not None:
+        user.update(fields)
+
+def _forget_cached_user(user_id):
+    global _user_writes
+    _user_writes += 1
+    _user_cache.pop(int(user_id), None)
+
+def _user_row(row) -> Dict:
+    user = dict(row)
+    for flag in ('is_banned', 'is_agreed_terms'):
+        if flag in user:
+            user[flag] = bool(user[flag])
+    return user
+
+def user_cache_stats() -> Dict:
+    return {"hits": _user_cache_hits, "misses": _user_cache_misses, "size": len(_user_cache)}
+
 async def get_user(user_id) -> Optional[Dict]:
+    global _user_cache_hits, _user_cache_misses
     try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (str(user_id),))
-            row = cursor.fetchone()
-            conn.close()
+        key = int(user_id)
+        cached = _user_cache.get(key)
+        if cached is not None:
+            _user_cache_hits += 1
+            _user_cache.move_to_end(key)
+            return dict(cached)
+        _user_cache_misses += 1
+
+        writes_before = _user_writes
+        row = await _fetchone('SELECT * FROM users WHERE telegram_id = ?', (key,))
         
         if row:
-            user = dict(row)
-            user['is_banned'] = bool(user['is_banned'])
-            user['is_agreed_terms'] = bool(user['is_agreed_terms'])
+            user = _user_row(row)
+            _cache_user(key, user, writes_before)
             
             if OWNER_ID and str(user_id) == str(OWNER_ID):
                 if user.get("role") != "owner":
@@ -104,33 +378,23 @@ async def get_user(user_id) -> Optional[Dict]:
 async def create_user(user_id) -> Optional[Dict]:
     try:
         now = datetime.utcnow().isoformat()
-        today = datetime.utcnow().date().isoformat()
         
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT 1 FROM users WHERE telegram_id = ?', (str(user_id),))
-            if cursor.fetchone():
-                conn.close()
-                return await get_user(user_id)
-            
-            cursor.execute('''
-                INSERT INTO users (telegram_id, role, 
-                                   is_agreed_terms, is_banned, ads_today, created_at, updated_at)
-                VALUES (?, 'free', 0, 0, 0, ?, ?)
-            ''', (str(user_id), now, now))
-            conn.commit()
-            conn.close()
+        inserted = await _execute('''
+            INSERT OR IGNORE INTO users (telegram_id, role, is_agreed_terms, is_banned, created_at, updated_at)
+            VALUES (?, 'free', 0, 0, ?, ?)
+        ''', (int(user_id), now, now))
+        _forget_cached_user(user_id)
+        if not inserted:
+            return await get_user(user_id)
         
         return {
-            "telegram_id": str(user_id),
+            "telegram_id": int(user_id),
             "role": "free",
             "is_agreed_terms": False,
-            "phone_session_string": None,
             "premium_expiry_date": None,
             "is_banned": False,
-            "created_at": now
+            "created_at": now,
+            "updated_at": now
         }
     except Exception as e:
         logger.error(f"Error creating user {user_id}: {e}")
@@ -138,38 +402,34 @@ async def create_user(user_id) -> Optional[Dict]:
 
 async def update_user_terms(user_id, agreed=True):
     try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET is_agreed_terms = ?, updated_at = ? WHERE telegram_id = ?',
-                           (1 if agreed else 0, datetime.utcnow().isoformat(), str(user_id)))
-            conn.commit()
-            conn.close()
+        await _execute('UPDATE users SET is_agreed_terms = ?, updated_at = ? WHERE telegram_id = ?',
+                       (1 if agreed else 0, datetime.utcnow().isoformat(), int(user_id)))
+        _update_cached_user(user_id, is_agreed_terms=bool(agreed))
     except Exception as e:
         logger.error(f"Error updating terms for {user_id}: {e}")
 
+async def get_session_string(user_id) -> Optional[str]:
+    """The user's saved login session, or None when they are not logged in."""
+    try:
+        row = await _fetchone('SELECT session_string FROM user_sessions WHERE telegram_id = ?', (int(user_id),))
+        return row['session_string'] if row else None
+    except Exception as e:
+        logger.error(f"Error getting session for {user_id}: {e}")
+        return None
+
 async def save_session_string(user_id, session_string):
     try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET phone_session_string = ?, updated_at = ? WHERE telegram_id = ?',
-                           (session_string, datetime.utcnow().isoformat(), str(user_id)))
-            conn.commit()
-            conn.close()
+        await _execute('''
+            INSERT INTO user_sessions (telegram_id, session_string, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET session_string = excluded.session_string, updated_at = excluded.updated_at
+        ''', (int(user_id), session_string, datetime.utcnow().isoformat()))
         logger.info(f"Saved session for user {user_id}")
     except Exception as e:
         logger.error(f"Error saving session for {user_id}: {e}")
 
 async def logout_user(user_id):
     try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET phone_session_string = NULL, updated_at = ? WHERE telegram_id = ?',
-                           (datetime.utcnow().isoformat(), str(user_id)))
-            conn.commit()
-            conn.close()
+        await _execute('DELETE FROM user_sessions WHERE telegram_id = ?', (int(user_id),))
         logger.info(f"User {user_id} logged out")
     except Exception as e:
         logger.error(f"Error logging out user {user_id}: {e}")
@@ -180,90 +440,169 @@ async def set_user_role(user_id, role, duration_days=None):
         if role == 'premium' and duration_days:
             expiry_date = (datetime.utcnow() + timedelta(days=int(duration_days))).isoformat()
         
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET role = ?, premium_expiry_date = ?, updated_at = ? WHERE telegram_id = ?',
-                           (role, expiry_date, datetime.utcnow().isoformat(), str(user_id)))
-            conn.commit()
-            conn.close()
+        await _execute('UPDATE users SET role = ?, premium_expiry_date = ?, updated_at = ? WHERE telegram_id = ?',
+                       (role, expiry_date, datetime.utcnow().isoformat(), int(user_id)))
+        _update_cached_user(user_id, role=role, premium_expiry_date=expiry_date)
     except Exception as e:
         logger.error(f"Error setting role for {user_id}: {e}")
 
 async def ban_user(user_id, is_banned=True):
     try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET is_banned = ?, updated_at = ? WHERE telegram_id = ?',
-                           (1 if is_banned else 0, datetime.utcnow().isoformat(), str(user_id)))
-            conn.commit()
-            conn.close()
+        await _execute('UPDATE users SET is_banned = ?, updated_at = ? WHERE telegram_id = ?',
+                       (1 if is_banned else 0, datetime.utcnow().isoformat(), int(user_id)))
+        _update_cached_user(user_id, is_banned=bool(is_banned))
     except Exception as e:
         logger.error(f"Error banning user {user_id}: {e}")
 
-async def check_and_update_quota(user_id):
+def _today():
+    return datetime.utcnow().date().isoformat()
+
+async def _usage_counters(user_id):
+    """
+    (key, today's [ads, transfers, bytes]) of a user, loaded from the database on first use.
+    Callers that change the counters mark this key dirty, so a bump across midnight
+    never marks a day that was not loaded.
+    """
+    key = (int(user_id), _today())
+    counters = _usage.get(key)
+    if counters is None:
+        row = await _fetchone('SELECT ads, transfers, bytes FROM daily_usage WHERE telegram_id = ? AND day = ?', key)
+        # Another caller may have loaded (and bumped) the counters while this one waited
+        counters = _usage.setdefault(key, list(row) if row else [0, 0, 0])
+    return key, counters
+
+async def _bump_usage(user_id, ads=0, transfers=0, nbytes=0):
+    key, counters = await _usage_counters(user_id)
+    counters[0] += ads
+    counters[1] += transfers
+    counters[2] += nbytes
+    _usage_dirty.add(key)
+
+def _transfer_limit(user) -> int:
+    """Transfers the user may start per day; 0 means unlimited."""
+    role = user.get("role", "free")
+    if role in ("owner", "admin"):
+        return 0
+    if role == "premium":
+        return PREMIUM_DAILY_TRANSFER_LIMIT
+    return DAILY_TRANSFER_LIMIT
+
+def _remaining(limit, counters, user_id) -> int:
+    return max(0, limit - counters[1] - _reserved.get(int(user_id), 0))
+
+async def check_and_update_quota(user_id, count=1):
+    """
+    Checks that the user may start `count` more transfers today and reserves them, so
+    links queued meanwhile cannot spend the same quota. Delivered transfers are moved from
+    the reservation to the counters by increment_quota; release_quota returns the rest.
+    """
     try:
-        user = await get_user(user_id)
-        if not user:
-            return False, "User not found."
+        # Users without a row yet are treated as free users
+        user = await get_user(user_id) or {}
         
         if user.get("is_banned"):
             return False, "You are banned from using this bot."
         
+        limit = _transfer_limit(user)
+        if limit:
+            _, counters = await _usage_counters(user_id)
+            remaining = _remaining(limit, counters, user_id)
+            if remaining < count:
+                if not remaining:
+                    return False, f"You have used all {limit} transfers for today. Try again tomorrow."
+                return False, f"You have {remaining} of {limit} transfers left today."
+            _reserved[int(user_id)] = _reserved.get(int(user_id), 0) + count
+        
         return True, "Success"
     except Exception as e:
         logger.error(f"Error checking quota for {user_id}: {e}")
         return False, "Database error."
 
-async def increment_quota(user_id, count=1):
-    pass
+def release_quota(user_id, count):
+    """Returns reserved transfers that were not delivered (failed, skipped, or never queued)."""
+    key = int(user_id)
+    left = _reserved.get(key, 0) - count
+    if left > 0:
+        _reserved[key] = left
+    else:
+        _reserved.pop(key, None)
+
+async def increment_quota(user_id, count=1, nbytes=0):
+    """Records delivered transfers; they stop counting as reserved."""
+    try:
+        await _bump_usage(user_id, transfers=count, nbytes=nbytes)
+        release_quota(user_id, count)
+    except Exception as e:
+        logger.error(f"Error incrementing quota for {user_id}: {e}")
 
 async def increment_ad_count(user_id):
     try:
-        today = datetime.utcnow().date().isoformat()
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET ads_today = ads_today + 1, last_ad_date = ? WHERE telegram_id = ?',
-                           (today, str(user_id)))
-            conn.commit()
-            conn.close()
+        await _bump_usage(user_id, ads=1)
     except Exception as e:
         logger.error(f"Error incrementing ad count for {user_id}: {e}")
 
 async def get_ad_count_today(user_id):
     try:
-        user = await get_user(user_id)
-        if not user:
-            return 0
-        
-        today = datetime.utcnow().date().isoformat()
-        if user.get("last_ad_date") != today:
-            with db_lock:
-                conn = _get_connection()
-                cursor = conn.cursor()
-                cursor.execute('UPDATE users SET ads_today = 0, last_ad_date = ? WHERE telegram_id = ?',
-                               (today, str(user_id)))
-                conn.commit()
-                conn.close()
-            return 0
-        return user.get("ads_today", 0)
+        _, counters = await _usage_counters(user_id)
+        return counters[0]
     except Exception as e:
         logger.error(f"Error getting ad count for {user_id}: {e}")
         return 0
 
 async def get_remaining_quota(user_id):
-    return 0, False
+    """Returns (transfers left today, is_unlimited)."""
+    try:
+        limit = _transfer_limit(await get_user(user_id) or {})
+        if not limit:
+            return 0, True
+        _, counters = await _usage_counters(user_id)
+        return _remaining(limit, counters, user_id), False
+    except Exception as e:
+        logger.error(f"Error getting remaining quota for {user_id}: {e}")
+        return 0, False
+
+async def get_usage_today(user_id) -> Dict:
+    try:
+        _, (ads, transfers, nbytes) = await _usage_counters(user_id)
+        return {"ads": ads, "transfers": transfers, "bytes": nbytes}
+    except Exception as e:
+        logger.error(f"Error getting usage for {user_id}: {e}")
+        return {"ads": 0, "transfers": 0, "bytes": 0}
+
+async def flush_usage():
+    """Writes changed counters in one transaction and drops finished days from memory."""
+    if _usage_dirty:
+        keys = list(_usage_dirty)
+        _usage_dirty.clear()
+        rows = [(*key, *_usage[key]) for key in keys]
+        try:
+            await _transaction(lambda conn: conn.executemany('''
+                INSERT INTO daily_usage (telegram_id, day, ads, transfers, bytes)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(telegram_id, day) DO UPDATE SET
+                    ads = excluded.ads, transfers = excluded.transfers, bytes = excluded.bytes
+            ''', rows))
+        except Exception:
+            # Counters still hold the totals, so the next flush writes them
+            _usage_dirty.update(keys)
+            raise
+
+    today = _today()
+    for key in [key for key in _usage if key[1] != today and key not in _usage_dirty]:
+        del _usage[key]
+
+async def flush_usage_loop():
+    """Periodically writes the in-memory usage counters to the database"""
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+        try:
+            await flush_usage()
+        except Exception as e:
+            logger.error(f"Usage flush error: {e}")
 
 async def get_setting(key):
     try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM settings WHERE key = ?', (key,))
-            row = cursor.fetchone()
-            conn.close()
+        row = await _fetchone('SELECT * FROM settings WHERE key = ?', (key,))
         
         if row:
             return dict(row)
@@ -274,49 +613,147 @@ async def get_setting(key):
 
 async def update_setting(key, value, json_value=None):
     try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO settings (key, value, json_value, updated_at)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT(key) DO UPDATE SET value = ?, json_value = ?, updated_at = ?
-            ''', (key, value, json_value, datetime.utcnow().isoformat(),
-                  value, json_value, datetime.utcnow().isoformat()))
-            conn.commit()
-            conn.close()
+        now = datetime.utcnow().isoformat()
+        await _execute('''
+            INSERT INTO settings (key, value, json_value, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = ?, json_value = ?, updated_at = ?
+        ''', (key, value, json_value, now, value, json_value, now))
     except Exception as e:
         logger.error(f"Error updating setting {key}: {e}")
 
-async def get_all_users() -> List[Dict]:
-    try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users')
-            rows = cursor.fetchall()
-            conn.close()
-        
-        users = []
+def _user_filters(role=None, banned=None, has_session=None):
+    clauses, params = [], []
+    if role is not None:
+        clauses.append('role = ?')
+        params.append(role)
+    if banned is not None:
+        clauses.append('is_banned = ?')
+        params.append(1 if banned else 0)
+    if has_session is not None:
+        exists = 'EXISTS (SELECT 1 FROM user_sessions s WHERE s.telegram_id = users.telegram_id)'
+        clauses.append(exists if has_session else f'NOT {exists}')
+    return clauses, params
+
+async def iter_users(columns=("telegram_id",), role=None, banned=None, has_session=None, batch_size=USER_BATCH_SIZE):
+    """
+    Yields users matching the filters as dicts holding only `columns`, in telegram_id order.
+    Reads batch_size rows per query, continuing after the last id seen, so memory stays
+    flat however many users there are.
+    """
+    unknown = set(columns) - set(USER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown user columns: {', '.join(sorted(unknown))}")
+    selected = ", ".join(dict.fromkeys(("telegram_id", *columns)))
+    clauses, params = _user_filters(role, banned, has_session)
+
+    last_id = None
+    while True:
+        where, args = list(clauses), list(params)
+        if last_id is not None:
+            where.append('telegram_id > ?')
+            args.append(last_id)
+        sql = f"SELECT {selected} FROM users"
+        if where:
+            sql += f" WHERE {' AND '.join(where)}"
+        rows = await _fetchall(sql + " ORDER BY telegram_id LIMIT ?", (*args, batch_size))
+
         for row in rows:
-            user = dict(row)
-            user['is_banned'] = bool(user['is_banned'])
-            user['is_agreed_terms'] = bool(user['is_agreed_terms'])
-            users.append(user)
-        return users
-    except Exception as e:
-        logger.error(f"Error getting all users: {e}")
-        return []
+            yield _user_row(row)
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]['telegram_id']
 
-async def get_user_count():
+async def get_user_count(role=None, banned=None, has_session=None):
     try:
-        with db_lock:
-            conn = _get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM users')
-            count = cursor.fetchone()[0]
-            conn.close()
-        return count
+        clauses, params = _user_filters(role, banned, has_session)
+        sql = 'SELECT COUNT(*) FROM users'
+        if clauses:
+            sql += f" WHERE {' AND '.join(clauses)}"
+        row = await _fetchone(sql, params)
+        return row[0]
     except Exception as e:
         logger.error(f"Error getting user count: {e}")
         return 0
+
+def _get_cached_media(conn, file_unique_id, now):
+    row = conn.execute('SELECT file_id, created_at FROM media_cache WHERE file_unique_id = ?', (file_unique_id,)).fetchone()
+    if row and datetime.fromisoformat(row['created_at']) < now - timedelta(days=MEDIA_CACHE_TTL_DAYS):
+        conn.execute('DELETE FROM media_cache WHERE file_unique_id = ?', (file_unique_id,))
+        return None
+    if row:
+        conn.execute('UPDATE media_cache SET hits = hits + 1, last_used_at = ? WHERE file_unique_id = ?',
+                     (now.isoformat(), file_unique_id))
+        return row['file_id']
+    return None
+
+async def get_cached_media(file_unique_id) -> Optional[str]:
+    """Returns the cached file_id for a source file, or None when missing or expired."""
+    try:
+        # Counts the hit, so it runs as a write
+        return await _transaction(_get_cached_media, file_unique_id, datetime.utcnow())
+    except Exception as e:
+        logger.error(f"Error reading media cache for {file_unique_id}: {e}")
+        return None
+
+def _cache_media(conn, file_unique_id, file_id, now):
+    cutoff = (now - timedelta(days=MEDIA_CACHE_TTL_DAYS)).isoformat()
+    conn.execute('''
+        INSERT INTO media_cache (file_unique_id, file_id, hits, created_at, last_used_at)
+        VALUES (?, ?, 0, ?, ?)
+        ON CONFLICT(file_unique_id) DO UPDATE SET file_id = ?, created_at = ?, last_used_at = ?
+    ''', (file_unique_id, file_id, now.isoformat(), now.isoformat(),
+          file_id, now.isoformat(), now.isoformat()))
+    
+    conn.execute('DELETE FROM media_cache WHERE created_at < ?', (cutoff,))
+    conn.execute('''
+        DELETE FROM media_cache WHERE file_unique_id IN (
+            SELECT file_unique_id FROM media_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+        )
+    ''', (MEDIA_CACHE_MAX_ENTRIES,))
+
+async def cache_media(file_unique_id, file_id):
+    """Stores the file_id of a successful upload and evicts expired / least recently used entries."""
+    try:
+        await _transaction(_cache_media, file_unique_id, file_id, datetime.utcnow())
+    except Exception as e:
+        logger.error(f"Error caching media {file_unique_id}: {e}")
+
+async def invalidate_cached_media(file_unique_id):
+    try:
+        await _execute('DELETE FROM media_cache WHERE file_unique_id = ?', (file_unique_id,))
+    except Exception as e:
+        logger.error(f"Error invalidating media cache for {file_unique_id}: {e}")
+
+async def save_peers(owner_id, peers):
+    """Upserts (peer_id, access_hash, type, username, last_seen) rows seen by the account owner_id."""
+    try:
+        rows = [(int(owner_id), *peer) for peer in peers]
+        await _transaction(lambda conn: conn.executemany('''
+            INSERT INTO peers (owner_id, peer_id, access_hash, type, username, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(owner_id, peer_id) DO UPDATE SET
+                access_hash = excluded.access_hash, type = excluded.type,
+                username = excluded.username, last_seen = excluded.last_seen
+        ''', rows))
+    except Exception as e:
+        logger.error(f"Error saving peers for {owner_id}: {e}")
+
+async def get_stored_peer(owner_id, peer_id) -> Optional[Dict]:
+    try:
+        row = await _fetchone('SELECT * FROM peers WHERE owner_id = ? AND peer_id = ?', (int(owner_id), int(peer_id)))
+        return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Error reading peer {peer_id} for {owner_id}: {e}")
+        return None
+
+async def get_stored_peer_by_username(owner_id, username) -> Optional[Dict]:
+    try:
+        row = await _fetchone('''
+            SELECT * FROM peers WHERE owner_id = ? AND username = ?
+            ORDER BY last_seen DESC LIMIT 1
+        ''', (int(owner_id), username.lower()))
+        return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Error reading peer @{username} for {owner_id}: {e}")
+        return None
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from pyrogram import Client
+from pyrogram.enums import ChatMemberStatus
+from pyrogram.errors import UserNotParticipant
+
+from bot.config import app
+from bot.database import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Seconds a membership answer is trusted. Non-members are re-checked soon so a fresh join gets through
+MEMBER_TTL = 600
+NON_MEMBER_TTL = 30
+# Expired answers are swept once the cache holds this many users
+PRUNE_AT = 10000
+
+NOT_MEMBER_STATUSES = (ChatMemberStatus.LEFT, ChatMemberStatus.BANNED)
+
+class ForceSubCache:
+    """
+    Force-sub channel setting plus per-user membership answers. Lookups of one user
+    share a single get_chat_member call, and join/leave updates from the channel
+    (when the bot is an admin there) update the cache directly.
+    """
+
+    def __init__(self):
+        self._channel = None
+        self._loaded = False
+        self._members = {}  # user_id -> (expires_at, is_member)
+        self._inflight = {}  # user_id -> asyncio.Future of the running lookup
+
+    async def channel(self):
+        """The configured channel ("@name" or "-100..."), or None when force-sub is off."""
+        if not self._loaded:
+            setting = await get_setting("force_sub_channel")
+            channel = setting.get('value') if setting else None
+            # Ensure channel starts with @ for compatibility
+            if channel and not channel.startswith("@") and not channel.startswith("-100"):
+                channel = f"@{channel}"
+            self._channel = channel or None
+            self._loaded = True
+        return self._channel
+
+    def reset(self):
+        """Call after the force_sub_channel setting changes."""
+        self._loaded = False
+        self._members.clear()
+
+    def record(self, user_id, is_member: bool):
+        now = time.monotonic()
+        if len(self._members) >= PRUNE_AT:
+            self._members = {u: v for u, v in self._members.items() if v[0] > now}
+        self._members[user_id] = (now + (MEMBER_TTL if is_member else NON_MEMBER_TTL), is_member)
+
+    async def _lookup(self, client: Client, channel, user_id) -> bool:
+        try:
+            member = await client.get_chat_member(channel, user_id)
+        except UserNotParticipant:
+            self.record(user_id, False)
+            return False
+        is_member = member.status not in NOT_MEMBER_STATUSES
+        self.record(user_id, is_member)
+        return is_member
+
+    async def is_member(self, client: Client, user_id) -> bool:
+        cached = self._members.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        pending = self._inflight.get(user_id)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.ensure_future(self._lookup(client, await self.channel(), user_id))
+        self._inflight[user_id] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._inflight.pop(user_id, None)
+
+    def is_channel(self, chat) -> bool:
+        channel = self._channel
+        if not channel or not chat:
+            return False
+        if channel.startswith("@"):
+            return (chat.username or "").lower() == channel[1:].lower()
+        return str(chat.id) == channel
+
+force_sub = ForceSubCache()
+
+@app.on_chat_member_updated()
+async def track_force_sub_members(client, update):
+    """Keeps cached answers current when users join or leave the force-sub channel."""
+    if not force_sub.is_channel(update.chat):
+        return
+    member = update.new_chat_member or update.old_chat_member
+    if not member or not member.user:
+        return
+    is_member = update.new_chat_member is not None and update.new_chat_member.status not in NOT_MEMBER_STATUSES
+    force_sub.record(member.user.id, is_member)
@@ -7,14 +7,37 @@ import aiofiles
 from pyrogram import filters, Client
 import pyrogram
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
-from bot.config import app, API_ID, API_HASH
-from bot.database import get_user, check_and_update_quota, get_setting
+from bot.config import app, TRANSFER_MODE, MAX_BATCH_MESSAGES, BATCH_CONCURRENCY
+from bot.database import get_user, get_session_string, check_and_update_quota, increment_quota, release_quota, get_cached_media, cache_media, invalidate_cached_media
 from bot.utils import progress_bar
+from bot.progress import progress_hub, BatchProgress
+from bot.scheduler import transfer_scheduler
+from bot.transfer import copy_messages, FORWARD_LIMIT
+from bot.user_clients import user_clients
+from bot.force_sub import force_sub
+from fast_dl.chat_cache import get_chat_cache
+
+# Most ids one get_messages call accepts
+GET_MESSAGES_LIMIT = 200
+
+_background = set()  # Strong references to detached tasks
+
+def delete_later(message: Message, delay: float):
+    """Deletes a status message after `delay` seconds without keeping the job's scheduler slot."""
+    async def delete():
+        await asyncio.sleep(delay)
+        try:
+            await message.delete()
+        except Exception:
+            pass
+    task = asyncio.create_task(delete())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
 
 async def is_public_chat(client: Client, chat_id: str):
     """Checks if a chat is a public channel or group."""
     try:
-        chat = await client.get_chat(str(chat_id))
+        chat = await get_chat_cache(client).get_chat(chat_id)
         # Public chats have a username
         is_public = getattr(chat, 'username', None) is not None
         # Check if it's a channel or group
@@ -23,32 +46,233 @@ async def is_public_chat(client: Client, chat_id: str):
     except Exception:
         return False
 
-async def parse_tg_link(link: str):
-    """Extracts chat_id and message_id from a Telegram link."""
-    # Matches: t.me/username/123 or t.me/c/123456789/123
-    TG_LINK_RE = re.compile(r"t\.me/(?:c/)?([^/]+)/(\d+)")
-    match = TG_LINK_RE.search(link)
-    if not match:
-        return None, None
-    chat_id_raw, msg_id = match.groups()
-    
-    # Private channel IDs look like numbers in the URL (prefixed with 'c/')
-    if chat_id_raw.isdigit():
-        chat_id = int(f"-100{chat_id_raw}")
-    else:
-        chat_id = chat_id_raw
-    return chat_id, int(msg_id)
+# Matches: t.me/username/123 or t.me/c/123456789/123, also ranges and lists like 100-250 or 5,9,12-15
+TG_LINK_RE = re.compile(r"t\.me/(?:c/)?([^/\s]+)/(\d+(?:-\d+)?(?:,\d+(?:-\d+)?)*)")
+
+def parse_msg_ids(spec: str):
+    """Expands "100-105,110" into message ids; stops one past MAX_BATCH_MESSAGES so callers can reject it."""
+    msg_ids = []
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        first, last = int(first), int(last or first)
+        if first > last:
+            first, last = last, first
+        msg_ids.extend(range(first, min(last, first + MAX_BATCH_MESSAGES) + 1))
+        if len(msg_ids) > MAX_BATCH_MESSAGES:
+            break
+    return list(dict.fromkeys(msg_ids))[:MAX_BATCH_MESSAGES + 1]
+
+async def parse_tg_links(text: str):
+    """
+    Extracts every Telegram link of a message as {chat_id: [message ids]}.
+    Repeated links and ids are dropped; chats keep the order they first appear in.
+    Parsing stops one id past MAX_BATCH_MESSAGES, which handle_link rejects anyway.
+    """
+    targets = {}  # chat_id -> dict used as an ordered set of ids
+    total = 0
+    for match in TG_LINK_RE.finditer(text):
+        chat_id_raw, msg_spec = match.groups()
+        
+        # Private channel IDs look like numbers in the URL (prefixed with 'c/')
+        if chat_id_raw.isdigit():
+            chat_id = int(f"-100{chat_id_raw}")
+        else:
+            chat_id = chat_id_raw
+        msg_ids = targets.setdefault(chat_id, {})
+        for msg_id in parse_msg_ids(msg_spec):
+            if msg_id not in msg_ids:
+                msg_ids[msg_id] = None
+                total += 1
+        if total > MAX_BATCH_MESSAGES:
+            break
+    return {chat_id: list(msg_ids) for chat_id, msg_ids in targets.items()}
+
+async def is_protected(user_client: Client, msg: Message) -> bool:
+    """True when the source forbids forwarding/saving, so only download → re-upload can deliver it."""
+    if msg.has_protected_content:
+        return True
+    chat_protected = getattr(msg.chat, "has_protected_content", None)
+    if chat_protected is None:
+        # Not part of the message's chat info (e.g. private chats): ask once, the answer is cached
+        try:
+            chat_protected = (await get_chat_cache(user_client).get_chat(msg.chat.id)).has_protected_content
+        except Exception:
+            return True
+    return bool(chat_protected)
+
+def media_size(messages) -> int:
+    """Combined file size of the media in messages, for the daily usage counters."""
+    return sum(getattr(getattr(m, m.media.value, None), "file_size", 0) or 0 for m in messages if m.media)
+
+async def copy_unprotected(client: Client, user_client: Client, messages):
+    """
+    Copies unprotected messages server-side with the user's own account into its chat with the bot,
+    i.e. the chat the user sent the link from. Returns None when they are protected or the copy fails,
+    so the caller falls back to download → re-upload.
+    """
+    for msg in messages:
+        if await is_protected(user_client, msg):
+            return None
+    try:
+        return await copy_messages(user_client, client.me.username, messages[0].chat.id, [m.id for m in messages])
+    except Exception as e:
+        print(f"Server-side copy from {messages[0].chat.id} failed, transferring instead: {e}")
+        return None
+
+async def deliver_media(client: Client, user_client: Client, to_chat_id, msg: Message, status_msg: Message = None, progress=None):
+    """
+    Sends one media message to to_chat_id through the bot. Unprotected messages are
+    copied server-side instead; re-uses our earlier upload of the same file when it is cached.
+    Batch items pass their own `progress` callback and leave the status message alone.
+    A failed relay falls back to downloading the file and uploading it from disk.
+    """
+    from bot.transfer import fast_download_with_metadata, fast_upload, fast_relay, get_sent_file_id
+
+    async def stage(text):
+        if not progress:
+            await progress_hub.edit(status_msg, text)
+
+    def stage_progress():
+        if progress:
+            return progress, ()
+        return progress_bar, (status_msg, time.time())
+
+    copied = await copy_unprotected(client, user_client, [msg])
+    if copied:
+        return copied
+
+    media = getattr(msg, msg.media.value)
+    cached_file_id = await get_cached_media(media.file_unique_id)
+    if cached_file_id:
+        try:
+            return await client.send_cached_media(to_chat_id, cached_file_id, caption=msg.caption or "")
+        except Exception as e:
+            print(f"Cached send failed for {media.file_unique_id}: {e}")
+            await invalidate_cached_media(media.file_unique_id)
+
+    sent = None
+    if TRANSFER_MODE == "relay" and getattr(media, "file_size", 0):
+        # Stream parts straight from the user session into the bot upload
+        await stage("🔄 **Transferring...**")
+        on_progress, progress_args = stage_progress()
+        sent = await fast_relay(
+            user_client,
+            client,
+            to_chat_id,
+            msg,
+            caption=msg.caption,
+            progress=on_progress,
+            progress_args=progress_args
+        )
+        if not sent:
+            print(f"Relay of {msg.chat.id}/{msg.id} failed, downloading it instead")
+
+    if not sent:
+        await stage("📥 **Downloading...**")
+        on_progress, progress_args = stage_progress()
+        file_path, video_metadata = await fast_download_with_metadata(
+            user_client, 
+            msg,
+            progress=on_progress,
+            progress_args=progress_args
+        )
+        
+        if not file_path:
+            return None
+            
+        await stage("📤 **Uploading to you...**")
+        on_progress, progress_args = stage_progress()
+        sent = await fast_upload(
+            client, 
+            to_chat_id, 
+            file_path, 
+            caption=msg.caption,
+            progress=on_progress,
+            progress_args=progress_args,
+            video_metadata=video_metadata
+        )
+
+    if sent:
+        file_id = await get_sent_file_id(client, sent)
+        if file_id:
+            await cache_media(media.file_unique_id, file_id)
+    return sent
+
+async def deliver_album(client: Client, user_client: Client, to_chat_id, messages, status_msg: Message):
+    """Sends a restricted media group to to_chat_id as one album."""
+    from bot.transfer import fast_album
+
+    messages = [m for m in messages if m.media]
+    if not messages:
+        return None
+    copied = await copy_unprotected(client, user_client, messages)
+    if copied:
+        return copied
+    await progress_hub.edit(status_msg, f"🔄 **Transferring album ({len(messages)} items)...**")
+    return await fast_album(
+        user_client,
+        client,
+        to_chat_id,
+        messages,
+        use_relay=TRANSFER_MODE == "relay",
+        progress=progress_bar,
+        progress_args=(status_msg, time.time())
+    )
 
 @app.on_message(filters.private & filters.text & ~filters.command(["start", "help", "login", "logout", "myinfo"]))
 async def handle_link(client: Client, message: Message):
     user_id = message.from_user.id
     link = message.text.strip()
     
-    chat_id, msg_id = await parse_tg_link(link)
-    if not chat_id:
-        return # Not a valid TG link
-        
-    # Step 1: Check if it's public (channel or group)
+    targets = await parse_tg_links(link)
+    if not targets:
+        return # No valid TG link
+    total = sum(len(msg_ids) for msg_ids in targets.values())
+    if total > MAX_BATCH_MESSAGES:
+        await message.reply(f"❌ One message can cover at most {MAX_BATCH_MESSAGES} messages.")
+        return
+    allowed, reason = await check_and_update_quota(user_id, total)
+    if not allowed:
+        await message.reply(f"❌ {reason}")
+        return
+
+    if total == 1:
+        chat_id, (msg_id,) = next(iter(targets.items()))
+        transfer = lambda: process_link(client, message, chat_id, msg_id, status_msg)
+    else:
+        transfer = lambda: process_batch(client, message, targets, status_msg)
+
+    async def job():
+        delivered = 0
+        try:
+            delivered = await transfer()
+        finally:
+            # Delivered items already left the reservation through increment_quota
+            release_quota(user_id, total - delivered)
+
+    # Transfers run in the background scheduler so this handler returns right away
+    user_data = await get_user(user_id)
+    role = user_data.get("role", "free") if user_data else "free"
+    status_msg = await message.reply("⏳ **Queued...**")
+
+    async def on_position(position):
+        await progress_hub.edit(status_msg, f"⏳ **Queued...** (position {position})")
+
+    position = transfer_scheduler.submit(
+        user_id,
+        role,
+        job,
+        on_position=on_position
+    )
+    if position is None:
+        release_quota(user_id, total)
+        await progress_hub.edit(status_msg, "❌ You have too many links queued. Please wait for them to finish.")
+    elif position:
+        await on_position(position)
+
+async def is_public_channel(client: Client, chat_id) -> bool:
+    """True for public channels, whose messages the bot can read and copy itself."""
+    # Check if it's public (channel or group)
     public = await is_public_chat(client, chat_id)
     
     # Logic update:
@@ -56,17 +280,23 @@ async def handle_link(client: Client, message: Message):
     # 2. If public group: Use download/upload method (restricted logic).
     # 3. If private: Use download/upload method (restricted logic).
     
-    is_public_channel_only = False
     if public:
         try:
-            chat = await client.get_chat(str(chat_id))
-            if str(chat.type) == "ChatType.CHANNEL":
-                is_public_channel_only = True
+            # Served from the cache filled by is_public_chat above
+            chat = await get_chat_cache(client).get_chat(chat_id)
+            return str(chat.type) == "ChatType.CHANNEL"
         except:
             pass
+    return False
+
+async def process_link(client: Client, message: Message, chat_id, msg_id, status_msg: Message):
+    """Sends the media of one message link; returns how many transfers were delivered (0 or 1)."""
+    user_id = message.from_user.id
+    delivered = 0
+    is_public_channel_only = await is_public_channel(client, chat_id)
 
     if is_public_channel_only:
-        status_msg = await message.reply("⏳ **Processing public channel...**")
+        await progress_hub.edit(status_msg, "⏳ **Processing public channel...**")
         try:
             # Direct Extraction via the bot client itself
             msg_response = await client.get_messages(chat_id, msg_id)
@@ -75,115 +305,184 @@ async def handle_link(client: Client, message: Message):
                 msg = msg_response[0] if isinstance(msg_response, list) else msg_response
                 if msg.media_group_id:
                     # It's part of a group, get all messages in that group
-                    await status_msg.edit("📦 **Downloading media group...**")
+                    await progress_hub.edit(status_msg, "📦 **Downloading media group...**")
                     messages = await client.get_media_group(chat_id, msg_id)
-                    for m in messages:
-                        if m.media:
-                            await m.copy(message.chat.id, caption=m.caption)
-                    await status_msg.edit("✅ **Download Complete!**")
+                    # One ForwardMessages call copies the whole album, captions included
+                    await copy_messages(client, message.chat.id, chat_id, [m.id for m in messages if m.media])
+                    await increment_quota(user_id, 1, media_size(messages))
+                    delivered = 1
+                    await progress_hub.edit(status_msg, "✅ **Download Complete!**")
                 elif msg.media:
-                    await status_msg.edit("📦 **Downloading...**")
+                    await progress_hub.edit(status_msg, "📦 **Downloading...**")
                     await msg.copy(message.chat.id, caption=msg.caption)
-                    await status_msg.edit("✅ **Download Complete!**")
+                    await increment_quota(user_id, 1, media_size([msg]))
+                    delivered = 1
+                    await progress_hub.edit(status_msg, "✅ **Download Complete!**")
                 else:
-                    await status_msg.edit("❌ This message does not contain media.")
+                    await progress_hub.edit(status_msg, "❌ This message does not contain media.")
             else:
-                await status_msg.edit("❌ Message not found.")
+                await progress_hub.edit(status_msg, "❌ Message not found.")
             
             # Auto-delete status message after 10 seconds
-            await asyncio.sleep(10)
-            await status_msg.delete()
-            return
+            delete_later(status_msg, 10)
+            return delivered
             
         except Exception as e:
-            await status_msg.edit(f"❌ Extraction failed: {str(e)}")
-            await asyncio.sleep(10)
-            await status_msg.delete()
-            return
+            await progress_hub.edit(status_msg, f"❌ Extraction failed: {str(e)}")
+            delete_later(status_msg, 10)
+            return delivered
     
     # For public groups, private channels, private groups, or bots:
     # Use download and upload method (Restricted Content Logic)
-    status_msg = await message.reply("⏳ **Processing via download/upload...**")
+    await progress_hub.edit(status_msg, "⏳ **Processing via download/upload...**")
     try:
-        from bot.transfer import fast_download_with_metadata, fast_upload
-        
         # Check if user is logged in
-        user_data = await get_user(user_id)
-        # Fix: The database uses 'phone_session_string' but the code checks for 'session'
-        session_string = user_data.get("phone_session_string") if user_data else None
+        session_string = await get_session_string(user_id)
         
         if not session_string:
-            await status_msg.edit("❌ Please /login first to download this content.")
-            return
+            await progress_hub.edit(status_msg, "❌ Please /login first to download this content.")
+            return delivered
 
-        async with Client("user_session", session_string=session_string, api_id=int(API_ID) if str(API_ID).isdigit() else 0, api_hash=str(API_HASH)) as user_client:
+        async with user_clients.acquire(user_id, session_string) as user_client:
             msg_response = await user_client.get_messages(chat_id, msg_id)
             if not msg_response:
-                await status_msg.edit("❌ No media found.")
-                return
+                await progress_hub.edit(status_msg, "❌ No media found.")
+                return delivered
             
             msg = msg_response[0] if isinstance(msg_response, list) else msg_response
             if not msg or not msg.media:
-                await status_msg.edit("❌ No media found.")
-                return
+                await progress_hub.edit(status_msg, "❌ No media found.")
+                return delivered
             
-            await status_msg.edit("📥 **Downloading...**")
-            start_time = time.time()
-            file_path, video_metadata = await fast_download_with_metadata(
-                user_client, 
-                msg,
-                progress=progress_bar,
-                progress_args=(status_msg, start_time)
-            )
-            
-            if not file_path:
-                await status_msg.edit("❌ Download failed.")
-                return
-                
-            await status_msg.edit("📤 **Uploading to you...**")
-            start_time = time.time()
-            sent = await fast_upload(
-                client, 
-                message.chat.id, 
-                file_path, 
-                caption=msg.caption,
-                progress=progress_bar,
-                progress_args=(status_msg, start_time),
-                video_metadata=video_metadata
-            )
+            if msg.media_group_id:
+                album = await user_client.get_media_group(chat_id, msg_id)
+                sent = await deliver_album(client, user_client, message.chat.id, album, status_msg)
+            else:
+                album = [msg]
+                sent = await deliver_media(client, user_client, message.chat.id, msg, status_msg)
             
             if sent:
-                await status_msg.edit("✅ **Transfer Complete!**")
+                await increment_quota(user_id, 1, media_size(album))
+                delivered = 1
+                await progress_hub.edit(status_msg, "✅ **Transfer Complete!**")
             else:
-                await status_msg.edit("❌ Upload failed.")
+                await progress_hub.edit(status_msg, "❌ Transfer failed.")
                 
     except Exception as e:
-        await status_msg.edit(f"❌ Error: {str(e)}")
+        await progress_hub.edit(status_msg, f"❌ Error: {str(e)}")
     
-    await asyncio.sleep(5)
-    await status_msg.delete()
+    delete_later(status_msg, 5)
+    return delivered
+
+async def process_batch(client: Client, message: Message, targets, status_msg: Message):
+    """
+    Sends every media message of targets ({chat_id: [message ids]}) as one job:
+    one status message, and one user client shared by all restricted chats.
+    Returns how many items were delivered.
+    """
+    user_id = message.from_user.id
+    progress = BatchProgress(status_msg, sum(len(msg_ids) for msg_ids in targets.values()))
+    await progress.show()
+    try:
+        # The bot can read public channels itself, so only the other chats need a user session
+        public = await asyncio.gather(*(is_public_channel(client, chat_id) for chat_id in targets))
+        batches = [(chat_id, msg_ids, via_bot) for (chat_id, msg_ids), via_bot in zip(targets.items(), public)]
+        restricted = [batch for batch in batches if not batch[2]]
+        session_string = await get_session_string(user_id) if restricted else None
+        if not restricted:
+            await run_batch(client, None, user_id, message.chat.id, batches, progress)
+        elif session_string:
+            async with user_clients.acquire(user_id, session_string) as user_client:
+                await run_batch(client, user_client, user_id, message.chat.id, batches, progress)
+        else:
+            # Without a login only the restricted chats fail; the bot still copies the rest
+            await progress.fail(sum(len(msg_ids) for _, msg_ids, _ in restricted))
+            await run_batch(client, None, user_id, message.chat.id, [b for b in batches if b[2]], progress)
+            await progress_hub.edit(status_msg, progress.render() + "\n\n❌ Please /login first to download the restricted messages.")
+            return progress.sent
+        await progress.show()
+    except Exception as e:
+        await progress_hub.edit(status_msg, f"❌ Error: {str(e)}")
+    return progress.sent
+
+async def run_batch(client: Client, user_client: Client, user_id, to_chat_id, batches, progress: BatchProgress):
+    """
+    Sends the media of batches, a list of (chat_id, msg_ids, via_bot). Message metadata is fetched
+    GET_MESSAGES_LIMIT ids per call while up to BATCH_CONCURRENCY items are already being sent.
+    via_bot chats are copied by the bot, FORWARD_LIMIT messages per ForwardMessages call; the others
+    go through user_client. Every sent item counts towards user_id's daily quota.
+    """
+    queue = asyncio.Queue(maxsize=BATCH_CONCURRENCY * 2)
+
+    async def copy_chunk(chat_id, media):
+        for i in range(0, len(media), FORWARD_LIMIT):
+            part = media[i:i + FORWARD_LIMIT]
+            try:
+                await copy_messages(client, to_chat_id, chat_id, [m.id for m in part])
+            except Exception as e:
+                print(f"Batch copy from {chat_id} failed: {e}")
+                await progress.fail(len(part))
+                continue
+            await increment_quota(user_id, len(part), media_size(part))
+            await progress.succeed(len(part))
+
+    async def fetch():
+        for chat_id, msg_ids, via_bot in batches:
+            source = client if via_bot else user_client
+            for i in range(0, len(msg_ids), GET_MESSAGES_LIMIT):
+                chunk = msg_ids[i:i + GET_MESSAGES_LIMIT]
+                try:
+                    messages = await source.get_messages(chat_id, chunk)
+                except Exception as e:
+                    # An inaccessible chat only costs its own items, not the rest of the batch
+                    print(f"Batch fetch from {chat_id} failed: {e}")
+                    messages = []
+                media = [m for m in messages if m and not m.empty and m.media]
+                if len(chunk) > len(media):
+                    await progress.skip(len(chunk) - len(media))
+                if via_bot:
+                    await copy_chunk(chat_id, media)
+                    continue
+                for m in media:
+                    await queue.put(m)
+
+    async def deliver():
+        while True:
+            m = await queue.get()
+            if m is None:
+                return
+            key = (m.chat.id, m.id)
+            try:
+                sent = await deliver_media(client, user_client, to_chat_id, m, progress=progress.item(key))
+            except Exception as e:
+                print(f"Batch item {m.chat.id}/{m.id} failed: {e}")
+                sent = None
+            if sent:
+                await increment_quota(user_id, 1, media_size([m]))
+            await progress.finish_item(key, bool(sent))
+
+    workers = [asyncio.create_task(deliver()) for _ in range(max(1, BATCH_CONCURRENCY))]
+    try:
+        await fetch()
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
 
 async def verify_force_sub(client, user_id):
-    from bot.config import OWNER_ID
-    
-    # Check database setting for force sub channel
-    setting = await get_setting("force_sub_channel")
-    if not setting or not setting.get('value'):
+    # Setting and membership answers are cached in bot.force_sub
+    channel = await force_sub.channel()
+    if not channel:
         return True, None
         
-    channel = setting['value']
-    # Ensure channel starts with @ for compatibility
-    if not channel.startswith("@") and not channel.startswith("-100"):
-        channel = f"@{channel}"
-        
     try:
-        member = await client.get_chat_member(channel, user_id)
-        if member.status in ["left", "kicked"]:
-             return False, channel
-        return True, None
+        if await force_sub.is_member(client, user_id):
+            return True, None
+        return False, channel
     except Exception as e:
-        # If user is not in the channel, pyrogram raises an error
-        # We catch it and return False to trigger the join prompt
+        # Any other lookup error also triggers the join prompt
         return False, channel
 
 @app.on_message(filters.command("help") & filters.private)
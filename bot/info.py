@@ -1,6 +1,7 @@
 from pyrogram import filters
 from bot.config import app
-from bot.database import get_user, check_and_update_quota
+from bot.database import get_user, get_session_string, check_and_update_quota, get_remaining_quota, get_usage_today
+from bot.utils import humanbytes
 
 @app.on_message(filters.command("myinfo") & filters.private)
 async def myinfo(client, message):
@@ -15,12 +16,17 @@ async def myinfo(client, message):
     
     expiry_info = ""
     if role_raw == 'premium' and user.get('premium_expiry_date'):
-        expiry_info = f"\nExpires: `{user.get('premium_expiry_date')}`"
+        expiry_info = f"Expires: `{user.get('premium_expiry_date')}`\n"
+
+    usage = await get_usage_today(user_id)
+    remaining, unlimited = await get_remaining_quota(user_id)
+    quota_info = "unlimited" if unlimited else f"{remaining} left"
 
     await message.reply(
         f"👤 **User Info**\n"
         f"ID: `{user_id}`\n"
         f"Role: **{role}**\n"
         f"{expiry_info}"
-        f"Logged in: {'Yes' if user.get('phone_session_string') else 'No'}"
+        f"Today: {usage['transfers']} transfers ({humanbytes(usage['bytes'])}), {quota_info}\n"
+        f"Logged in: {'Yes' if await get_session_string(user_id) else 'No'}"
     )
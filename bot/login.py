@@ -4,7 +4,8 @@ from pyrogram import filters, Client
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import SessionPasswordNeeded, PhoneCodeInvalid, PasswordHashInvalid
 from bot.config import app, login_states, API_ID, API_HASH
-from bot.database import get_user, create_user, update_user_terms, save_session_string, logout_user
+from bot.database import get_user, get_session_string, create_user, update_user_terms, save_session_string, logout_user
+from bot.user_clients import user_clients
 
 @app.on_message(filters.command("start") & filters.private)
 async def start(client, message):
@@ -71,7 +72,7 @@ async def login_start(client, message):
         await message.reply("Please agree to the Terms & Conditions first using /start.")
         return
 
-    if user.get('phone_session_string'):
+    if await get_session_string(user_id):
         await message.reply("You are already logged in! Contact support if you need to re-login.")
         return
 
@@ -251,8 +252,9 @@ async def logout(client, message):
                 pass
         del login_states[user_id]
 
-    if user and user.get('phone_session_string'):
+    if user and await get_session_string(user_id):
         await logout_user(user_id)
+        await user_clients.evict(user_id)
         await message.reply("✅ Logged out successfully! Your session has been cleared.")
     else:
         await message.reply("You are not logged in.")
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from pyrogram import Client
+from pyrogram.storage.sqlite_storage import get_input_peer
+
+from bot.database import save_peers, get_stored_peer, get_stored_peer_by_username
+
+logger = logging.getLogger(__name__)
+
+# Seconds between writes of newly seen peers to the database
+FLUSH_INTERVAL = 5
+# Usernames can change hands, so stored ones are trusted for as long as Pyrogram's own cache does
+USERNAME_TTL = 8 * 60 * 60
+
+# owner_id -> {peer_id: (peer_id, access_hash, type, username, last_seen)} waiting to be written
+_pending = {}
+
+class PeerStore:
+    """
+    Backs a client's peer cache with the `peers` table, so access hashes survive
+    restarts and fresh user clients. Wraps the methods of `client.storage`:
+    seen peers are queued for the database, and in-memory misses fall back to it.
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+        self.storage = client.storage
+        self._update_peers = self.storage.update_peers
+        self._get_peer_by_id = self.storage.get_peer_by_id
+        self._get_peer_by_username = self.storage.get_peer_by_username
+
+    def attach(self):
+        self.storage.update_peers = self.update_peers
+        self.storage.get_peer_by_id = self.get_peer_by_id
+        self.storage.get_peer_by_username = self.get_peer_by_username
+
+    async def _owner_id(self):
+        # Known once the client is authorized; peers seen before that are not persisted
+        return await self.storage.user_id()
+
+    async def update_peers(self, peers):
+        await self._update_peers(peers)
+
+        owner_id = await self._owner_id()
+        if not owner_id:
+            return
+        now = int(time.time())
+        queued = _pending.setdefault(owner_id, {})
+        for peer_id, access_hash, peer_type, username, _phone_number in peers:
+            queued[peer_id] = (peer_id, access_hash, peer_type, username, now)
+
+    async def _restore(self, row):
+        # Copy into the in-memory cache so later lookups never reach the database
+        await self._update_peers([(row["peer_id"], row["access_hash"], row["type"], row["username"], None)])
+        return get_input_peer(row["peer_id"], row["access_hash"], row["type"])
+
+    async def get_peer_by_id(self, peer_id: int):
+        try:
+            return await self._get_peer_by_id(peer_id)
+        except KeyError:
+            if not isinstance(peer_id, int):
+                # resolve_peer tries usernames here first; those are looked up by get_peer_by_username
+                raise
+            owner_id = await self._owner_id()
+            row = await get_stored_peer(owner_id, peer_id) if owner_id else None
+            if not row:
+                raise
+            return await self._restore(row)
+
+    async def get_peer_by_username(self, username: str):
+        try:
+            return await self._get_peer_by_username(username)
+        except KeyError:
+            owner_id = await self._owner_id()
+            row = await get_stored_peer_by_username(owner_id, username) if owner_id else None
+            if not row or time.time() - (row["last_seen"] or 0) > USERNAME_TTL:
+                raise
+            return await self._restore(row)
+
+def attach_peer_store(client: Client) -> Client:
+    """Makes `client` read and write the persistent peer store. Call before the client starts."""
+    PeerStore(client).attach()
+    return client
+
+async def flush_peers():
+    while _pending:
+        owner_id, peers = _pending.popitem()
+        await save_peers(owner_id, list(peers.values()))
+
+async def flush_peers_loop():
+    """Periodically writes newly seen peers to the database in batches"""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush_peers()
+        except Exception as e:
+            logger.error(f"Peer store flush error: {e}")
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import time
+from typing import Callable
+from pyrogram.errors import FloodWait, MessageNotModified
+
+from bot.utils import humanbytes, time_formatter
+
+logger = logging.getLogger(__name__)
+
+# How often the ticker looks at the watched messages
+TICK_SECONDS = 1.0
+# Edits sent per tick across all status messages
+MAX_EDITS_PER_TICK = 5
+# Shortest gap between two edits of one status message
+MIN_EDIT_INTERVAL = 3.0
+
+class _Watched:
+    def __init__(self, message, render: Callable):
+        self.message = message
+        self.render = render
+        self.last_text = None
+        self.edited_at = 0.0
+        self.edit_task = None
+        self.tracker = None  # TransferProgress behind render, for report_bytes
+
+class TransferProgress:
+    """Byte counters of one transfer, rendered into the classic progress bar text."""
+
+    def __init__(self, start_time: float):
+        self.start_time = start_time
+        self.current = 0
+        self.total = 0
+
+    def render(self) -> str:
+        diff = time.time() - self.start_time
+        speed = self.current / diff if diff > 0 else 0
+        if not self.total:
+            # Unknown size (plain stream): only the bytes so far are known
+            return f"**Transferring...**\n\n📦 {humanbytes(self.current)}\n🚀 Speed: {humanbytes(speed)}/s"
+
+        percentage = self.current * 100 / self.total
+        eta = round((self.total - self.current) / speed) if speed > 0 else 0
+        progress = "[{0}{1}]".format(
+            '●' * int(percentage / 10),
+            '○' * (10 - int(percentage / 10))
+        )
+        return f"**Transferring...**\n\n{progress} {round(percentage, 2)}%\n" \
+               f"🚀 Speed: {humanbytes(speed)}/s\n" \
+               f"⏱️ ETA: {time_formatter(eta)}"
+
+class ProgressHub:
+    """
+    Edits every active status message from one background ticker, so transfers only
+    bump counters and never wait on Telegram. Edits are capped at MAX_EDITS_PER_TICK
+    overall and MIN_EDIT_INTERVAL per message, unchanged text is never sent, and a chat
+    that got a FloodWait is left alone until it expires.
+    """
+
+    def __init__(self):
+        self._watched = {}  # (chat_id, message_id) -> _Watched
+        self._paused_until = {}  # chat_id -> monotonic time its FloodWait ends
+        self._ticker = None
+
+    @staticmethod
+    def _key(message):
+        return message.chat.id, message.id
+
+    def watch(self, message, render: Callable):
+        """Keeps `message` showing render() until it is edited through edit() or unwatched."""
+        watched = self._watched.get(self._key(message))
+        if watched:
+            watched.render = render
+        else:
+            self._watched[self._key(message)] = _Watched(message, render)
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._tick_loop())
+
+    def unwatch(self, message):
+        self._watched.pop(self._key(message), None)
+
+    def report_bytes(self, message, current: int, total: int, start_time: float):
+        """Records transfer progress for `message`; the ticker decides when it is shown."""
+        watched = self._watched.get(self._key(message))
+        tracker = watched.tracker if watched else None
+        if tracker is None or tracker.start_time != start_time:
+            tracker = TransferProgress(start_time)
+            self.watch(message, tracker.render)
+            self._watched[self._key(message)].tracker = tracker
+        tracker.current, tracker.total = current, total
+
+    def _pause(self, chat_id, seconds):
+        self._paused_until[chat_id] = time.monotonic() + seconds
+        logger.info(f"Status edits in {chat_id} paused for {seconds}s (FloodWait)")
+
+    async def edit(self, message, text: str):
+        """Edits a status message right away (stage changes, results) and stops tracking it."""
+        watched = self._watched.pop(self._key(message), None)
+        if watched and watched.edit_task and not watched.edit_task.done():
+            # Let a progress edit already on its way land first, so it cannot overwrite this one
+            await asyncio.wait([watched.edit_task])
+        if watched and watched.last_text == text:
+            return
+
+        delay = self._paused_until.get(message.chat.id, 0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await message.edit_text(text)
+        except FloodWait as e:
+            # Final states still have to reach the user, so this one waits and retries once
+            self._pause(message.chat.id, e.value)
+            await asyncio.sleep(e.value)
+            try:
+                await message.edit_text(text)
+            except Exception as e:
+                logger.debug(f"Status edit failed: {e}")
+        except MessageNotModified:
+            pass
+        except Exception as e:
+            logger.debug(f"Status edit failed: {e}")
+
+    async def _edit_watched(self, key, watched: _Watched, text: str):
+        try:
+            await watched.message.edit_text(text)
+            watched.last_text = text
+        except FloodWait as e:
+            self._pause(watched.message.chat.id, e.value)
+        except MessageNotModified:
+            watched.last_text = text
+        except Exception as e:
+            # Deleted or otherwise uneditable: stop tracking it
+            logger.debug(f"Progress edit failed: {e}")
+            if self._watched.get(key) is watched:
+                del self._watched[key]
+
+    async def _tick_loop(self):
+        while self._watched:
+            await asyncio.sleep(TICK_SECONDS)
+            now = time.monotonic()
+            budget = MAX_EDITS_PER_TICK
+
+            # Messages that waited longest go first
+            for key, watched in sorted(self._watched.items(), key=lambda item: item[1].edited_at):
+                if budget <= 0:
+                    break
+                if now - watched.edited_at < MIN_EDIT_INTERVAL:
+                    continue
+                if self._paused_until.get(key[0], 0) > now:
+                    continue
+                try:
+                    text = watched.render()
+                except Exception as e:
+                    logger.debug(f"Progress render failed: {e}")
+                    continue
+                if not text or text == watched.last_text:
+                    continue
+
+                if watched.edit_task and not watched.edit_task.done():
+                    continue
+
+                budget -= 1
+                watched.edited_at = now
+                # Runs on its own so a slow edit never holds up the others
+                watched.edit_task = asyncio.create_task(self._edit_watched(key, watched, text))
+
+            for chat_id, until in list(self._paused_until.items()):
+                if until <= now:
+                    del self._paused_until[chat_id]
+
+class BatchProgress:
+    """
+    Status of a whole batch: items finished so far plus the combined speed
+    of the items in flight, shown through the progress hub.
+    """
+
+    def __init__(self, message, total):
+        self.message = message
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.start_time = time.time()
+        self._current = {}  # item key -> bytes moved so far
+        self._finished_bytes = 0
+
+    def item(self, key):
+        """Progress callback for one item of the batch."""
+        async def progress(current, total):
+            self._current[key] = current
+            self.refresh()
+        return progress
+
+    async def finish_item(self, key, ok):
+        self._finished_bytes += self._current.pop(key, 0)
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+        self.refresh()
+
+    async def succeed(self, count=1):
+        self.sent += count
+        self.refresh()
+
+    async def fail(self, count=1):
+        self.failed += count
+        self.refresh()
+
+    async def skip(self, count=1):
+        self.skipped += count
+        self.refresh()
+
+    def render(self) -> str:
+        moved = self._finished_bytes + sum(self._current.values())
+        diff = time.time() - self.start_time
+        speed = moved / diff if diff > 0 else 0
+        finished = self.sent + self.failed + self.skipped
+        text = f"**Batch:** {finished}/{self.total}\n" \
+               f"✅ Sent: {self.sent}  ❌ Failed: {self.failed}  ⏭️ Skipped: {self.skipped}\n" \
+               f"🚀 Speed: {humanbytes(speed)}/s"
+        if self._current:
+            text += f"\n📦 In progress: {len(self._current)}"
+        return text
+
+    def refresh(self):
+        progress_hub.watch(self.message, self.render)
+
+    async def show(self):
+        """Shows the current state right away, e.g. at the start and end of the batch."""
+        await progress_hub.edit(self.message, self.render())
+
+progress_hub = ProgressHub()
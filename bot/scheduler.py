@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+from bot.config import MAX_CONCURRENT_JOBS, MAX_JOBS_PER_USER, MAX_QUEUED_PER_USER
+
+logger = logging.getLogger(__name__)
+
+# Lower lanes are served first; users inside a lane take turns
+ROLE_LANES = {"owner": 0, "admin": 0, "premium": 1}
+FREE_LANE = 2
+
+class TransferJob:
+    def __init__(self, user_id, lane: int, run: Callable[[], Awaitable], on_position: Optional[Callable] = None):
+        self.user_id = user_id
+        self.lane = lane
+        self.run = run
+        self.on_position = on_position
+        self.position = None
+        self.notify_task = None  # Latest on_position call, so updates land in order
+
+class TransferScheduler:
+    """
+    Queue of transfer jobs run in the background with a global and a per-user cap.
+    Owner/admin and premium jobs get priority lanes, and users within a lane are
+    served round-robin so one user's batch cannot starve the others.
+    """
+
+    def __init__(self, max_jobs: int = MAX_CONCURRENT_JOBS, max_per_user: int = MAX_JOBS_PER_USER, max_queued: int = MAX_QUEUED_PER_USER):
+        self.max_jobs = max(1, max_jobs)
+        self.max_per_user = max(1, max_per_user)
+        self.max_queued = max_queued
+        self._lanes = {}  # lane -> OrderedDict(user_id -> deque of jobs), in turn order
+        self._running = {}  # user_id -> running job count
+        self._active = 0
+        self._tasks = set()  # Strong references so running jobs are not garbage collected
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+
+    def _queued(self, user_id) -> int:
+        return sum(len(users.get(user_id, ())) for users in self._lanes.values())
+
+    def submit(self, user_id, role: str, run: Callable[[], Awaitable], on_position: Optional[Callable] = None) -> Optional[int]:
+        """
+        Queues `run()` for user_id. Returns the 1-based queue position
+        (0 when it starts right away) or None if the user's queue is full.
+        `on_position(position)` is called in the background whenever the position changes.
+        """
+        if self._queued(user_id) >= self.max_queued:
+            return None
+
+        job = TransferJob(user_id, ROLE_LANES.get(role, FREE_LANE), run, on_position)
+        users = self._lanes.setdefault(job.lane, OrderedDict())
+        users.setdefault(user_id, deque()).append(job)
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        self._wakeup.set()
+
+        job.position = self._positions().get(job, 0)
+        free_slots = self.max_jobs - self._active
+        if job.position <= free_slots and self._running.get(user_id, 0) < self.max_per_user:
+            return 0
+        return job.position
+
+    def _order(self):
+        """Jobs in the order they would start if every slot freed up now."""
+        order = []
+        for lane in sorted(self._lanes):
+            queues = [list(q) for q in self._lanes[lane].values()]
+            depth = max((len(q) for q in queues), default=0)
+            for i in range(depth):
+                order.extend(q[i] for q in queues if i < len(q))
+        return order
+
+    def _positions(self):
+        return {job: i + 1 for i, job in enumerate(self._order())}
+
+    def _next(self) -> Optional[TransferJob]:
+        for lane in sorted(self._lanes):
+            users = self._lanes[lane]
+            for user_id in list(users):
+                if self._running.get(user_id, 0) >= self.max_per_user:
+                    continue
+                queue = users.pop(user_id)
+                job = queue.popleft()
+                if queue:
+                    # Back of the line for this user's next job
+                    users[user_id] = queue
+                return job
+        return None
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._active < self.max_jobs:
+                job = self._next()
+                if job is None:
+                    break
+                job.position = 0
+                self._active += 1
+                self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+                task = asyncio.create_task(self._run(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            self._report_positions()
+
+    def _report_positions(self):
+        # Never awaited here: an edit stuck in one chat's FloodWait must not hold up dispatch
+        for job, position in self._positions().items():
+            if position != job.position:
+                job.position = position
+                if job.on_position:
+                    job.notify_task = asyncio.create_task(self._notify(job, position, job.notify_task))
+                    self._tasks.add(job.notify_task)
+                    job.notify_task.add_done_callback(self._tasks.discard)
+
+    async def _notify(self, job: TransferJob, position: int, previous: Optional[asyncio.Task]):
+        if previous and not previous.done():
+            await asyncio.wait([previous])
+        if job.position != position:
+            # Moved again or already started while waiting; a newer update covers it
+            return
+        try:
+            await job.on_position(position)
+        except Exception as e:
+            logger.debug(f"Queue position update failed for {job.user_id}: {e}")
+
+    async def _run(self, job: TransferJob):
+        try:
+            await job.run()
+        except Exception as e:
+            logger.error(f"Transfer job for {job.user_id} failed: {e}")
+        finally:
+            self._active -= 1
+            self._running[job.user_id] -= 1
+            if not self._running[job.user_id]:
+                del self._running[job.user_id]
+            self._wakeup.set()
+
+transfer_scheduler = TransferScheduler()
@@ -4,56 +4,91 @@ import os
 import time
 from pyrogram.client import Client
 from pyrogram.errors import FloodWait
+from pyrogram import raw, types
 from bot.config import API_ID, API_HASH
 
-from fast_dl.fast_download import FastDownload
-from fast_dl.fast_upload import FastUpload
+from fast_dl.chat_cache import get_chat_cache
+from fast_dl.fast_download import FastDownload, forget_staging, release_staging
+from fast_dl.fast_upload import FastUpload, MAX_INFLIGHT_BYTES
+from fast_dl.relay import FastRelay
+from fast_dl.tuning import MAX_INFLIGHT
 
-async def fast_download(client: Client, message, chunk_size=1024*1024, num_workers=8, progress=None, progress_args=()):
+# Attempts per download; each retry resumes from the parts already on disk
+DOWNLOAD_ATTEMPTS = 3
+# Most message ids one ForwardMessages call accepts
+FORWARD_LIMIT = 100
+
+async def fast_download(client: Client, message, chunk_size=1024*1024, num_workers=MAX_INFLIGHT, progress=None, progress_args=()):
     """
     Optimized download using FastDownload helper.
     """
+    downloader = FastDownload(client, part_size=chunk_size, num_workers=num_workers)
+    media = getattr(message, message.media.value) if message.media else None
+    if not media:
+        return None
+    # One path for all attempts, so a retry resumes into the same file
+    file_path = downloader.resolve_path(message, media)
+    downloaded = None
     try:
-        downloader = FastDownload(client)
-        file_path = await downloader.download(
-            message,
-            progress=progress,
-            progress_args=progress_args
-        )
-        return file_path
-    except FloodWait as e:
-        await asyncio.sleep(float(getattr(e, 'value', 0) or getattr(e, 'x', 0)))
-        return await fast_download(client, message, chunk_size, num_workers)
-    except Exception as e:
-        print(f"Download error: {e}")
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            try:
+                downloaded = await downloader.download(
+                    message,
+                    file_name=file_path,
+                    progress=progress,
+                    progress_args=progress_args
+                )
+                return downloaded
+            except FloodWait as e:
+                await asyncio.sleep(float(getattr(e, 'value', 0) or getattr(e, 'x', 0)))
+            except Exception as e:
+                print(f"Download error (attempt {attempt}/{DOWNLOAD_ATTEMPTS}): {e}")
         return None
+    finally:
+        if not downloaded:
+            # Given up or cancelled: keep the partial file for a resend to resume into;
+            # sweep_staging reclaims it if none comes within STAGING_MAX_AGE
+            forget_staging(file_path)
 
-async def fast_download_with_metadata(client: Client, message, chunk_size=1024*1024, num_workers=8, progress=None, progress_args=()):
+async def fast_download_with_metadata(client: Client, message, chunk_size=1024*1024, num_workers=MAX_INFLIGHT, progress=None, progress_args=()):
     """
     Optimized download with video metadata extraction.
     Returns: (file_path, metadata_dict)
     """
+    downloader = FastDownload(client, part_size=chunk_size, num_workers=num_workers)
+    media = getattr(message, message.media.value) if message.media else None
+    if not media:
+        return None, {}
+    # One path for all attempts, so a retry resumes into the same file
+    file_path = downloader.resolve_path(message, media)
+    downloaded = None
     try:
-        downloader = FastDownload(client)
-        file_path, metadata = await downloader.download_with_metadata(
-            message,
-            progress=progress,
-            progress_args=progress_args
-        )
-        return file_path, metadata
-    except FloodWait as e:
-        await asyncio.sleep(float(getattr(e, 'value', 0) or getattr(e, 'x', 0)))
-        return await fast_download_with_metadata(client, message, chunk_size, num_workers)
-    except Exception as e:
-        print(f"Download error: {e}")
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            try:
+                downloaded, metadata = await downloader.download_with_metadata(
+                    message,
+                    file_name=file_path,
+                    progress=progress,
+                    progress_args=progress_args
+                )
+                return downloaded, metadata
+            except FloodWait as e:
+                await asyncio.sleep(float(getattr(e, 'value', 0) or getattr(e, 'x', 0)))
+            except Exception as e:
+                print(f"Download error (attempt {attempt}/{DOWNLOAD_ATTEMPTS}): {e}")
         return None, {}
+    finally:
+        if not downloaded:
+            # Given up or cancelled: keep the partial file for a resend to resume into;
+            # sweep_staging reclaims it if none comes within STAGING_MAX_AGE
+            forget_staging(file_path)
 
-async def fast_upload(client: Client, chat_id, file_path, caption=None, num_workers=8, progress=None, progress_args=(), video_metadata=None):
+async def fast_upload(client: Client, chat_id, file_path, caption=None, num_workers=MAX_INFLIGHT, progress=None, progress_args=(), video_metadata=None):
     """
     Optimized upload using FastUpload helper.
     """
     try:
-        uploader = FastUpload(client)
+        uploader = FastUpload(client, num_workers=num_workers)
         sent = await uploader.upload(
             chat_id,
             file_path,
@@ -62,15 +97,136 @@ async def fast_upload(client: Client, chat_id, file_path, caption=None, num_work
             progress_args=progress_args,
             video_metadata=video_metadata
         )
-        
-        # Cleanup
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            
         return sent
-    except FloodWait as e:
-        await asyncio.sleep(float(getattr(e, 'value', 0) or getattr(e, 'x', 0)))
-        return await fast_upload(client, chat_id, file_path, caption, num_workers, video_metadata=video_metadata)
     except Exception as e:
+        # FloodWaits and transient errors are already retried per part inside FastUpload
         print(f"Upload error: {e}")
         return None
+    finally:
+        release_staging(file_path)
+
+async def fast_relay(src_client: Client, dst_client: Client, chat_id, message, caption=None, num_workers=MAX_INFLIGHT, progress=None, progress_args=()):
+    """
+    Streams media from src_client to chat_id via dst_client without writing it to disk.
+    """
+    try:
+        relay = FastRelay(src_client, dst_client, num_workers=num_workers)
+        return await relay.relay(
+            message,
+            chat_id,
+            caption=caption or "",
+            progress=progress,
+            progress_args=progress_args
+        )
+    except Exception as e:
+        print(f"Relay error: {e}")
+        return None
+
+async def fast_album(src_client: Client, dst_client: Client, chat_id, messages, use_relay=True, num_workers=MAX_INFLIGHT, progress=None, progress_args=()):
+    """
+    Sends restricted album items as one grouped message: every item is transferred
+    in parallel (relayed, or staged on disk), then all go out in a single SendMultiMedia.
+    An item whose relay fails is staged on disk instead.
+    """
+    # The items split one transfer's worth of in-flight parts and memory between them
+    item_workers = max(2, num_workers // max(1, len(messages)))
+    item_budget = MAX_INFLIGHT_BYTES // max(1, len(messages))
+    uploader = FastUpload(dst_client, num_workers=num_workers, max_inflight_bytes=item_budget)
+    sizes = {m.id: getattr(getattr(m, m.media.value), "file_size", 0) or 0 for m in messages}
+    # Disk mode moves every byte twice: down, then up
+    total = sum(sizes.values()) * (1 if use_relay else 2)
+    moved = {}
+    paths = []
+
+    def item_progress(key):
+        async def on_progress(current, _total):
+            moved[key] = current
+            if progress:
+                await progress(sum(moved.values()), total, *progress_args)
+        return on_progress
+
+    async def prepare(m):
+        nonlocal total
+        if use_relay and sizes[m.id]:
+            relay = FastRelay(src_client, dst_client, num_workers=item_workers, max_inflight_bytes=item_budget)
+            try:
+                return await relay.relay_media(m, progress=item_progress(m.id))
+            except Exception as e:
+                print(f"Relay of album item {m.id} failed, downloading it instead: {e}")
+            # The disk path moves the item's bytes twice, from the start
+            moved.pop(m.id, None)
+            total += sizes[m.id]
+
+        file_path, video_metadata = await fast_download_with_metadata(
+            src_client,
+            m,
+            num_workers=item_workers,
+            progress=item_progress((m.id, "down"))
+        )
+        if not file_path:
+            raise RuntimeError(f"Album item {m.id} could not be downloaded")
+        paths.append(file_path)
+        input_file = await uploader.upload_file(file_path, progress=item_progress((m.id, "up")))
+        return await uploader.input_media(input_file, os.path.basename(file_path), video_metadata)
+
+    tasks = [asyncio.create_task(prepare(m)) for m in messages]
+    try:
+        medias = await asyncio.gather(*tasks)
+        items = [(media, m.caption or "") for media, m in zip(medias, messages) if media]
+        if not items:
+            return None
+        return await uploader.send_album(chat_id, items)
+    except Exception as e:
+        print(f"Album error: {e}")
+        return None
+    finally:
+        # One failed item fails the album; stop the others before their files are removed
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for path in paths:
+            release_staging(path)
+
+async def copy_messages(client: Client, to_chat_id, from_chat_id, msg_ids):
+    """
+    Copies messages server-side: a forward without the author header, captions kept.
+    Sends FORWARD_LIMIT ids per ForwardMessages call, so an album stays grouped and takes one round trip.
+    FloodWaits are waited out and retried with the same random_ids, so nothing is sent twice.
+    """
+    chats = get_chat_cache(client)
+    from_peer = await chats.resolve_peer(from_chat_id)
+    to_peer = await chats.resolve_peer(to_chat_id)
+
+    results = []
+    for i in range(0, len(msg_ids), FORWARD_LIMIT):
+        chunk = list(msg_ids[i:i + FORWARD_LIMIT])
+        query = raw.functions.messages.ForwardMessages(
+            from_peer=from_peer,
+            id=chunk,
+            random_id=[client.rnd_id() for _ in chunk],
+            to_peer=to_peer,
+            drop_author=True
+        )
+        while True:
+            try:
+                results.append(await client.invoke(query))
+                break
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+    return results
+
+async def get_sent_file_id(client: Client, sent):
+    """
+    Returns the file_id of the media in a raw SendMedia result (None if there is none).
+    """
+    try:
+        users = {u.id: u for u in getattr(sent, "users", [])}
+        chats = {c.id: c for c in getattr(sent, "chats", [])}
+        for update in getattr(sent, "updates", []):
+            if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+                msg = await types.Message._parse(client, update.message, users, chats)
+                media = getattr(msg, msg.media.value) if msg.media else None
+                return getattr(media, "file_id", None)
+    except Exception as e:
+        print(f"Could not read sent file_id: {e}")
+    return None
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pyrogram import Client
+from pyrogram.errors import Unauthorized
+from pyrogram.raw import functions
+
+from bot.config import API_ID, API_HASH, USER_CLIENT_POOL_SIZE, USER_CLIENT_IDLE_TIMEOUT
+from bot.peer_store import attach_peer_store
+from fast_dl.sessions import close_session_pool
+from fast_dl.chat_cache import drop_chat_cache
+
+logger = logging.getLogger(__name__)
+
+# Pooled clients idle for longer than this are checked before they are reused
+HEALTH_CHECK_AFTER = 60
+
+class _PooledClient:
+    def __init__(self, client: Client, session_string: str):
+        self.client = client
+        self.session_string = session_string
+        self.last_used = time.monotonic()
+        self.users = 0
+        self.evicted = False
+
+class UserClientPool:
+    """
+    LRU pool of connected user-session clients keyed by telegram_id.
+    Saves the connect/handshake/sync cost of a fresh Client for every restricted link.
+    """
+
+    def __init__(self, max_size: int = USER_CLIENT_POOL_SIZE, idle_timeout: int = USER_CLIENT_IDLE_TIMEOUT):
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self._entries = OrderedDict()  # telegram_id -> _PooledClient, least recently used first
+        self._locks = {}  # telegram_id -> asyncio.Lock, so concurrent links share one connect
+
+    async def _start_client(self, user_id, session_string: str) -> Client:
+        client = Client(
+            f"user_{user_id}",
+            session_string=session_string,
+            api_id=int(API_ID) if str(API_ID).isdigit() else 0,
+            api_hash=str(API_HASH),
+            in_memory=True,
+            no_updates=True
+        )
+        attach_peer_store(client)
+        await client.start()
+        return client
+
+    async def _close(self, entry: _PooledClient):
+        try:
+            # Extra media connections must close before the client disconnects
+            await close_session_pool(entry.client)
+            drop_chat_cache(entry.client)
+            await entry.client.stop()
+        except Exception as e:
+            logger.debug(f"Error stopping pooled user client: {e}")
+
+    async def _healthy(self, entry: _PooledClient) -> bool:
+        if time.monotonic() - entry.last_used < HEALTH_CHECK_AFTER:
+            return True
+        try:
+            # Needs a valid authorization, so it also catches revoked sessions
+            await entry.client.invoke(functions.updates.GetState())
+            return True
+        except Exception as e:
+            logger.info(f"Dropping unhealthy pooled user client: {e}")
+            return False
+
+    async def _get(self, user_id, session_string: str) -> _PooledClient:
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(user_id)
+            if entry:
+                # Counted as in use while checking, so reap_idle cannot close it under us
+                entry.users += 1
+                try:
+                    healthy = entry.session_string == session_string and await self._healthy(entry)
+                finally:
+                    entry.users -= 1
+                if entry.evicted:
+                    # Evicted elsewhere (e.g. /logout) during the check
+                    if entry.users == 0:
+                        await self._close(entry)
+                    entry = None
+                elif not healthy:
+                    await self.evict(user_id)
+                    entry = None
+
+            if not entry:
+                client = await self._start_client(user_id, session_string)
+                entry = self._entries[user_id] = _PooledClient(client, session_string)
+                await self._trim()
+
+            self._entries.move_to_end(user_id)
+            entry.users += 1
+            return entry
+
+    async def _trim(self):
+        """Closes least recently used idle clients while the pool is over its size."""
+        for user_id in list(self._entries):
+            if len(self._entries) <= self.max_size:
+                break
+            if self._entries[user_id].users == 0:
+                await self._close(self._entries.pop(user_id))
+
+    @asynccontextmanager
+    async def acquire(self, user_id, session_string: str):
+        """Yields a connected client for the user's session, starting one if needed."""
+        entry = await self._get(user_id, session_string)
+        try:
+            yield entry.client
+        except Unauthorized:
+            # Session revoked or expired: never hand this client out again
+            if self._entries.get(user_id) is entry:
+                await self.evict(user_id)
+            entry.evicted = True
+            raise
+        finally:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+            if entry.evicted and entry.users == 0:
+                await self._close(entry)
+
+    async def evict(self, user_id):
+        """Removes the user's client (on /logout or revocation); closes it once no transfer uses it."""
+        entry = self._entries.pop(user_id, None)
+        if not entry or entry.evicted:
+            return
+        entry.evicted = True
+        if entry.users == 0:
+            await self._close(entry)
+
+    async def reap_idle(self):
+        for user_id, entry in list(self._entries.items()):
+            if entry.users == 0 and time.monotonic() - entry.last_used > self.idle_timeout:
+                self._entries.pop(user_id, None)
+                await self._close(entry)
+        # Locks of users without a pooled client are only kept while someone holds them
+        for user_id, lock in list(self._locks.items()):
+            if user_id not in self._entries and not lock.locked():
+                del self._locks[user_id]
+
+user_clients = UserClientPool()
+
+async def reap_idle_user_clients():
+    """Periodically disconnects pooled user clients nobody used for a while"""
+    while True:
+        await asyncio.sleep(60)
+        try:
+            await user_clients.reap_idle()
+        except Exception as e:
+            logger.error(f"User client reaper error: {e}")
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import OrderedDict
+from pyrogram import Client
+from pyrogram.errors import BadRequest, Forbidden
+
+# Seconds a looked-up chat / resolved peer stays valid
+CHAT_TTL = 600
+PEER_TTL = 3600
+# Chats the client cannot access are remembered for this long, so repeated links fail fast
+NEGATIVE_TTL = 60
+# Entries kept per client before the least recently used are dropped
+MAX_ENTRIES = 5000
+
+# Errors that say the chat itself is inaccessible (private, banned, unknown username, ...).
+# FloodWait and server/network errors are never cached.
+NEGATIVE_ERRORS = (BadRequest, Forbidden, KeyError, ValueError)
+
+class ChatInfo:
+    """The parts of a chat the bot actually looks at."""
+
+    def __init__(self, chat):
+        self.id = chat.id
+        self.type = chat.type
+        self.username = getattr(chat, "username", None)
+        self.has_protected_content = bool(getattr(chat, "has_protected_content", False))
+
+class ChatCache:
+    """
+    TTL cache of chat info and resolved InputPeers for one client.
+    Failed lookups are cached briefly, and concurrent lookups of the same chat share one request.
+    """
+
+    def __init__(self, client: Client, max_entries: int = MAX_ENTRIES):
+        self.client = client
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (kind, key) -> (expires_at, value, error)
+        self._inflight = {}  # (kind, key) -> asyncio.Future of the running lookup
+
+    @staticmethod
+    def _key(chat_id):
+        if isinstance(chat_id, int):
+            return chat_id
+        chat_id = str(chat_id).strip().lstrip("@")
+        if chat_id.lstrip("-").isdigit():
+            return int(chat_id)
+        return chat_id.lower()
+
+    async def _lookup(self, kind: str, chat_id, fetch, ttl: int):
+        key = (kind, self._key(chat_id))
+
+        entry = self._entries.get(key)
+        if entry:
+            expires_at, value, error = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                if error:
+                    raise error
+                return value
+            del self._entries[key]
+
+        # Single flight: later callers wait for the lookup that is already running
+        pending = self._inflight.get(key)
+        if pending:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The caller that ran the lookup was cancelled; run it ourselves
+                return await self._lookup(kind, chat_id, fetch, ttl)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch(chat_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except NEGATIVE_ERRORS as e:
+            self._store(key, NEGATIVE_TTL, None, e)
+            future.set_exception(e)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            self._store(key, ttl, value, None)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+            if not future.cancelled():
+                # Marks the error as retrieved when no other caller was waiting on it
+                future.exception()
+
+    def _store(self, key, ttl: int, value, error):
+        self._entries[key] = (time.monotonic() + ttl, value, error)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _fetch_chat(self, chat_id) -> ChatInfo:
+        chat = await self.client.get_chat(chat_id)
+        info = ChatInfo(chat)
+        if info.username:
+            # Link by username and link by id resolve to the same chat
+            self._store(("chat", info.id), CHAT_TTL, info, None)
+        return info
+
+    async def get_chat(self, chat_id) -> ChatInfo:
+        """Cached `client.get_chat`; raises the (cached) error for inaccessible chats."""
+        return await self._lookup("chat", chat_id, self._fetch_chat, CHAT_TTL)
+
+    async def resolve_peer(self, chat_id):
+        """Cached `client.resolve_peer`."""
+        return await self._lookup("peer", chat_id, self.client.resolve_peer, PEER_TTL)
+
+    def invalidate(self, chat_id):
+        key = self._key(chat_id)
+        for kind in ("chat", "peer"):
+            self._entries.pop((kind, key), None)
+
+_caches = {}
+
+def get_chat_cache(client: Client) -> ChatCache:
+    """Returns the chat cache of `client`, creating it on first use."""
+    cache = _caches.get(client)
+    if cache is None:
+        cache = _caches[client] = ChatCache(client)
+    return cache
+
+def drop_chat_cache(client: Client):
+    """Forgets the chat cache of a client that is being stopped."""
+    _caches.pop(client, None)
@@ -1,21 +1,101 @@
 import asyncio
 import aiofiles
+import math
 import os
+import shutil
+import time
 from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.file_id import FileId, FileType
+from pyrogram.raw import functions, types
+
+from fast_dl.resume import ResumeState
+from fast_dl.sessions import MediaSessionPool, get_session_pool
+from fast_dl.tuning import AdaptiveController, MAX_INFLIGHT
+from fast_dl.writer import PositionalWriter
+
+# upload.GetFile accepts limits that are a multiple of 4 KB and divide 1 MB
+PART_SIZE = 1024 * 1024  # 1MB
+# Upper bound on concurrent GetFile requests; the controller picks the actual count
+NUM_WORKERS = MAX_INFLIGHT
+# Staged files get a directory per source file (named by file_unique_id), so transfers
+# running side by side never share a file, thumbnail or resume record
+DOWNLOAD_DIR = os.path.abspath("downloads")
+
+# Unclaimed staging directories (given-up transfers, earlier runs) are kept this long for a resend to resume into
+STAGING_MAX_AGE = 60 * 60
+# How often sweep_staging_loop looks for expired staging directories
+STAGING_SWEEP_INTERVAL = 10 * 60
+
+_staging = set()  # staging directories held by a running transfer
+
+def claim_staging_dir(file_unique_id: str) -> str:
+    """Creates the staging directory of a file; the same file moved twice at once gets a second one."""
+    directory, copy = os.path.join(DOWNLOAD_DIR, file_unique_id), 1
+    while directory in _staging:
+        copy += 1
+        directory = os.path.join(DOWNLOAD_DIR, f"{file_unique_id}-{copy}")
+    _staging.add(directory)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def release_staging(path: str):
+    """Deletes a staged file together with its thumbnail and resume record."""
+    directory = os.path.dirname(os.path.abspath(path))
+    if os.path.dirname(directory) == DOWNLOAD_DIR:
+        shutil.rmtree(directory, ignore_errors=True)
+        _staging.discard(directory)
+        return
+    # A caller-chosen path outside DOWNLOAD_DIR: only remove what belongs to this file
+    for leftover in (path, f"{path}.resume", f"{path}_thumb.jpg"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+def forget_staging(path: str):
+    """
+    Drops the claim on a staged file's directory but keeps its contents, so a resend of the
+    same file resumes from the partial data. sweep_staging reclaims it once it expires.
+    """
+    _staging.discard(os.path.dirname(os.path.abspath(path)))
+
+def sweep_staging(max_age: int = STAGING_MAX_AGE):
+    """Removes unclaimed staging directories that were not touched for max_age seconds."""
+    if not os.path.isdir(DOWNLOAD_DIR):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(DOWNLOAD_DIR):
+        if not entry.is_dir() or entry.path in _staging:
+            continue
+        try:
+            touched = max([f.stat().st_mtime for f in os.scandir(entry.path)] + [entry.stat().st_mtime])
+        except FileNotFoundError:
+            continue
+        if touched < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+async def sweep_staging_loop(interval: int = STAGING_SWEEP_INTERVAL):
+    """Periodically reclaims the disk space of expired staging directories"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            sweep_staging()
+        except Exception as e:
+            print(f"Staging sweep error: {e}")
 
 class FastDownload:
-    def __init__(self, client: Client):
+    def __init__(self, client: Client, part_size: int = PART_SIZE, num_workers: int = NUM_WORKERS):
+        if part_size % 4096 or (1024 * 1024) % part_size:
+            raise ValueError(f"Invalid part size: {part_size}")
         self.client = client
+        self.part_size = part_size
+        self.num_workers = max(1, num_workers)
 
-    async def download(self, message, file_name: str = "", progress=None, progress_args=()):
-        # 1. Identify the media object in the message
-        media = getattr(message, message.media.value) if message.media else None
-        if not media:
-            return None
-
-        # 2. Determine file name (handle None values properly)
+    def resolve_path(self, message, media, file_name: str = ""):
+        """`file_name` if given, else the media's own name inside a freshly claimed staging directory."""
+        if file_name:
+            return file_name
         media_file_name = getattr(media, "file_name", None)
-        
+
         # Determine extension based on media type if no filename exists
         ext = ".bin"
         if message.video:
@@ -27,14 +107,144 @@ class FastDownload:
         elif message.photo:
             ext = ".jpg"
 
-        default_name = f"{media.file_id[:10]}{ext}"
-        file_path = file_name or media_file_name or default_name
-        
-        # 3. Stream and write to file
-        async with aiofiles.open(file_path, "wb") as f:
-            async for chunk in self.client.stream_media(message):
-                await f.write(chunk)
-        
+        # file_id prefixes are the same for every file of a type, file_unique_id is not
+        default_name = f"{media.file_unique_id}{ext}"
+        name = os.path.basename(media_file_name or "") or default_name
+        return os.path.join(claim_staging_dir(media.file_unique_id), name)
+
+    def _location(self, file_id: FileId):
+        if file_id.file_type == FileType.PHOTO:
+            return types.InputPhotoFileLocation(
+                id=file_id.media_id,
+                access_hash=file_id.access_hash,
+                file_reference=file_id.file_reference,
+                thumb_size=file_id.thumbnail_size
+            )
+        return types.InputDocumentFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size
+        )
+
+    async def _get_part(self, pool: MediaSessionPool, dc_id: int, location, index: int, controller: AdaptiveController) -> bytes:
+        while True:
+            started = await controller.acquire()
+            try:
+                r = await pool.invoke(
+                    dc_id,
+                    functions.upload.GetFile(
+                        location=location,
+                        offset=index * self.part_size,
+                        limit=self.part_size
+                    )
+                )
+            except FloodWait as e:
+                controller.release(started)
+                controller.flood_wait()
+                await asyncio.sleep(e.value)
+                continue
+            except BaseException:
+                controller.release(started)
+                raise
+
+            if isinstance(r, types.upload.File):
+                controller.release(started, len(r.bytes))
+                return r.bytes
+            controller.release(started)
+            raise RuntimeError(f"Unexpected GetFile response: {type(r).__name__}")
+
+    async def fetch_parts(self, media, on_part, parts):
+        """
+        Fetches the given part indexes with up to `num_workers` concurrent GetFile requests,
+        the actual number being tuned by an AdaptiveController for the file's DC.
+        Requests are spread over the client's pooled media sessions to that DC.
+        `on_part(index, data)` is awaited for every part, in completion order.
+        """
+        parts = list(parts)
+        if not parts:
+            return
+
+        file_id = FileId.decode(media.file_id)
+        location = self._location(file_id)
+
+        queue = asyncio.Queue()
+        for index in parts:
+            queue.put_nowait(index)
+
+        pool = get_session_pool(self.client)
+        controller = AdaptiveController("download", file_id.dc_id, max_limit=self.num_workers)
+
+        async def worker():
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                data = await self._get_part(pool, file_id.dc_id, location, index, controller)
+                await on_part(index, data)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(min(self.num_workers, len(parts)))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            controller.finish()
+
+    async def download(self, message, file_name: str = "", progress=None, progress_args=()):
+        # 1. Identify the media object in the message
+        media = getattr(message, message.media.value) if message.media else None
+        if not media:
+            return None
+
+        # 2. Determine file name (handle None values properly)
+        file_path = self.resolve_path(message, media, file_name)
+        file_size = getattr(media, "file_size", 0) or 0
+
+        # 3. Unknown size: fall back to a plain sequential stream
+        if not file_size:
+            received = 0
+            async with aiofiles.open(file_path, "wb") as f:
+                async for chunk in self.client.stream_media(message):
+                    await f.write(chunk)
+                    received += len(chunk)
+                    if progress:
+                        await progress(received, 0, *progress_args)
+            return file_path
+
+        # 4. Pick up where a previous attempt stopped, if it left a resume record
+        state = ResumeState.load(file_path, media.file_unique_id, file_size, self.part_size)
+        written = state.done_bytes()
+
+        def on_written(offset, size):
+            nonlocal written
+            first = offset // self.part_size
+            last = math.ceil((offset + size) / self.part_size)
+            for index in range(first, last):
+                state.mark(index)
+            written += size
+
+        # 5. Fetch missing parts in parallel and write them by offset as they arrive
+        writer = PositionalWriter(file_path, file_size, on_written=on_written)
+        await writer.open(keep_existing=state.resumed)
+
+        async def on_part(index, data):
+            await writer.write(index * self.part_size, data)
+            if state.due():
+                state.save()
+            if progress:
+                await progress(written, file_size, *progress_args)
+
+        try:
+            await self.fetch_parts(media, on_part, state.missing())
+        finally:
+            # Whatever reached the disk is recorded so the next attempt skips it
+            await writer.close()
+            state.save()
+
+        state.discard()
         return file_path
 
     async def download_with_metadata(self, message, file_name: str = "", progress=None, progress_args=()):
@@ -46,24 +256,25 @@ class FastDownload:
         if not media:
             return None, {}
 
-        media_file_name = getattr(media, "file_name", None)
-        
-        ext = ".bin"
-        if message.video:
-            ext = ".mp4"
-        elif message.audio:
-            ext = ".mp3"
-        elif message.document:
-            ext = ".pdf"
-        elif message.photo:
-            ext = ".jpg"
+        file_path = self.resolve_path(message, media, file_name)
 
-        default_name = f"{media.file_id[:10]}{ext}"
-        file_path = file_name or media_file_name or default_name
-        
-        # Extract video metadata before downloading
+        metadata = await self.fetch_metadata(message, file_path)
+
+        file_path = await self.download(
+            message,
+            file_name=file_path,
+            progress=progress,
+            progress_args=progress_args
+        )
+        return file_path, metadata
+
+    async def fetch_metadata(self, message, file_path: str) -> dict:
+        """Extracts video metadata and downloads the largest thumbnail next to `file_path`."""
         metadata = {}
-        if message.video:
+        if message.photo:
+            # Re-sent as a photo, not a document, so it can share an album with videos
+            metadata = {"is_photo": True}
+        elif message.video:
             video = message.video
             metadata = {
                 "duration": getattr(video, "duration", 0) or 0,
@@ -71,7 +282,7 @@ class FastDownload:
                 "height": getattr(video, "height", 720) or 720,
                 "is_video": True
             }
-            
+
             # Download thumbnail if available
             if video.thumbs and len(video.thumbs) > 0:
                 try:
@@ -79,18 +290,13 @@ class FastDownload:
                     thumb_path = f"{file_path}_thumb.jpg"
                     # Download thumbnail using its file_id
                     if hasattr(thumb, 'file_id') and thumb.file_id:
-                        await self.client.download_media(
+                        thumb_path = await self.client.download_media(
                             thumb.file_id,
                             file_name=thumb_path
                         )
-                        if os.path.exists(thumb_path):
+                        if thumb_path and os.path.exists(thumb_path):
                             metadata["thumb_path"] = thumb_path
                 except Exception as e:
                     print(f"Thumbnail download error: {e}")
-        
-        # Stream and write to file
-        async with aiofiles.open(file_path, "wb") as f:
-            async for chunk in self.client.stream_media(message):
-                await f.write(chunk)
-        
-        return file_path, metadata
+
+        return metadata
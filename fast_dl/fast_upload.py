@@ -1,14 +1,51 @@
 import asyncio
 import os
 import math
+import random
 from pyrogram.client import Client
+from pyrogram.errors import BadRequest, FloodWait, FilePartMissing, InternalServerError
 from pyrogram.raw import functions, types
 from typing import Callable, Union, Optional
 import logging
 
+from fast_dl.chat_cache import get_chat_cache
+from fast_dl.sessions import get_session_pool
+from fast_dl.tuning import AdaptiveController, MAX_INFLIGHT
+from fast_dl.writer import IO_EXECUTOR
+
+logger = logging.getLogger(__name__)
+
+# SaveBigFilePart parts must divide 512 KB; files above 10 MB must use it
+PART_SIZE = 512 * 1024  # 512KB
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024
+
+# Per-part retry policy: jittered exponential backoff, FloodWait honoured for that part only
+PART_ATTEMPTS = 5
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 30
+# Extra passes that re-send only the parts still missing after the first pass
+VERIFY_ROUNDS = 2
+
+# Upper bound on concurrent part uploads; the controller picks the actual count
+NUM_WORKERS = MAX_INFLIGHT
+# Hard cap on part buffers held at once; each worker owns one part-sized buffer
+MAX_INFLIGHT_BYTES = 8 * 1024 * 1024  # 8MB
+
+def _read_part(fd: int, buf: bytearray, offset: int):
+    """Reads one part from the shared descriptor into a reusable buffer."""
+    if hasattr(os, "preadv"):
+        n = os.preadv(fd, [buf], offset)
+    else:
+        data = os.pread(fd, len(buf), offset)
+        n = len(data)
+        buf[:n] = data
+    return memoryview(buf)[:n]
+
 class FastUpload:
-    def __init__(self, client: Client):
+    def __init__(self, client: Client, num_workers: int = NUM_WORKERS, max_inflight_bytes: int = MAX_INFLIGHT_BYTES):
         self.client = client
+        self.num_workers = max(1, num_workers)
+        self.max_inflight_bytes = max_inflight_bytes
 
     async def upload(
         self,
@@ -20,70 +57,199 @@ class FastUpload:
         video_metadata: dict = None,
         **kwargs
     ):
+        input_file = await self.upload_file(path, progress, progress_args)
+        file_name = os.path.basename(path)
+        return await self.resend_missing(
+            path,
+            input_file,
+            lambda: self.send_file(chat_id, input_file, file_name, caption, video_metadata)
+        )
+
+    async def upload_file(self, path: str, progress: Optional[Callable] = None, progress_args: tuple = ()):
+        """Saves every part of `path` and returns the InputFile/InputFileBig to send it with."""
         if not os.path.exists(path):
             raise FileNotFoundError(f"File not found: {path}")
 
         file_size = os.path.getsize(path)
         file_name = os.path.basename(path)
-        chunk_size = 512 * 1024  # 512KB
-        is_big = file_size > 10 * 1024 * 1024
+        chunk_size = PART_SIZE
+        is_big = file_size > BIG_FILE_THRESHOLD
         
         num_chunks = math.ceil(file_size / chunk_size)
-        semaphore = asyncio.Semaphore(8)
+        num_workers = max(1, min(self.num_workers, self.max_inflight_bytes // chunk_size, num_chunks))
         completed_bytes = 0
+        uploaded = set()
+        errors = []
+        loop = asyncio.get_running_loop()
+        controller = await self.controller(num_workers)
 
-        import random
         file_id = random.randint(0, 2**63 - 1)
 
-        async def upload_chunk(chunk_index):
+        async def worker(queue):
             nonlocal completed_bytes
-            async with semaphore:
-                with open(path, "rb") as f:
-                    f.seek(chunk_index * chunk_size)
-                    chunk_data = f.read(chunk_size)
+            buf = bytearray(chunk_size)  # Reused for every part this worker sends
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    data = await loop.run_in_executor(IO_EXECUTOR, _read_part, fd, buf, index * chunk_size)
+                    await self.save_part(file_id, index, num_chunks, data, is_big, controller)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+
+                uploaded.add(index)
+                completed_bytes += len(data)
+                if progress:
+                    await progress(completed_bytes, file_size, *progress_args)
+
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            # First pass sends every part, verification passes only the ones that failed
+            parts = range(num_chunks)
+            for _ in range(VERIFY_ROUNDS + 1):
+                queue = asyncio.Queue()
+                for index in parts:
+                    queue.put_nowait(index)
+                await asyncio.gather(*(worker(queue) for _ in range(min(num_workers, len(parts)))))
+
+                parts = [i for i in range(num_chunks) if i not in uploaded]
+                if not parts:
+                    break
+                logger.warning(f"Re-sending {len(parts)} failed parts of {file_name}")
+            else:
+                raise errors[-1] if errors else RuntimeError(f"{len(parts)} parts of {file_name} were not saved")
+
+            return self.input_file(file_id, num_chunks, file_name, is_big)
+        finally:
+            controller.finish()
+            os.close(fd)
 
+    async def resend_missing(self, path: str, input_file, finalize: Callable):
+        """Awaits finalize(); if the server lost a part we sent, re-sends just that one and finalizes again."""
+        try:
+            return await finalize()
+        except FilePartMissing as e:
+            is_big = isinstance(input_file, types.InputFileBig)
+            with open(path, "rb") as f:
+                f.seek(e.value * PART_SIZE)
+                data = f.read(PART_SIZE)
+            await self.save_part(input_file.id, e.value, input_file.parts, data, is_big)
+            return await finalize()
+
+    async def controller(self, max_limit: int = NUM_WORKERS) -> AdaptiveController:
+        """In-flight limiter for uploads, which always go to the client's home DC."""
+        return AdaptiveController("upload", await self.client.storage.dc_id(), max_limit=max_limit)
+
+    async def save_part(
+        self,
+        file_id: int,
+        index: int,
+        total_parts: int,
+        data: bytes,
+        is_big: bool,
+        controller: Optional[AdaptiveController] = None
+    ):
+        """Saves one part, retrying FloodWaits and transient errors for this part only."""
+        # Parts go over pooled media sessions to the home DC, not the main connection
+        pool = get_session_pool(self.client)
+        dc_id = await self.client.storage.dc_id()
+        for attempt in range(1, PART_ATTEMPTS + 1):
+            started = await controller.acquire() if controller else 0
+            saved = False
+            error = RuntimeError(f"Part {index} was not saved")
+            try:
                 if is_big:
-                    await self.client.invoke(
+                    saved = await pool.invoke(
+                        dc_id,
                         functions.upload.SaveBigFilePart(
                             file_id=file_id,
-                            file_part=chunk_index,
-                            file_total_parts=num_chunks,
-                            bytes=chunk_data
+                            file_part=index,
+                            file_total_parts=total_parts,
+                            bytes=data
                         )
                     )
                 else:
-                    await self.client.invoke(
+                    saved = await pool.invoke(
+                        dc_id,
                         functions.upload.SaveFilePart(
                             file_id=file_id,
-                            file_part=chunk_index,
-                            bytes=chunk_data
+                            file_part=index,
+                            bytes=data
                         )
                     )
-                
-                completed_bytes += len(chunk_data)
-                if progress:
-                    await progress(completed_bytes, file_size, *progress_args)
+            except (FloodWait, InternalServerError, OSError, asyncio.TimeoutError) as e:
+                error = e
+            finally:
+                if controller:
+                    controller.release(started, len(data) if saved else 0)
+
+            if saved:
+                return
 
-        tasks = [upload_chunk(i) for i in range(num_chunks)]
-        await asyncio.gather(*tasks)
+            if isinstance(error, FloodWait):
+                # Only this part waits, and it does not hold an in-flight slot meanwhile
+                if controller:
+                    controller.flood_wait()
+                await asyncio.sleep(error.value + random.uniform(0, 1))
+            elif attempt < PART_ATTEMPTS:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(delay / 2, delay))
 
+        raise error
+
+    def input_file(self, file_id: int, parts: int, file_name: str, is_big: bool):
         if is_big:
-            input_file = types.InputFileBig(
+            return types.InputFileBig(
                 id=file_id,
-                parts=num_chunks,
+                parts=parts,
                 name=file_name
             )
-        else:
-            input_file = types.InputFile(
-                id=file_id,
-                parts=num_chunks,
-                name=file_name,
-                md5_checksum=""
+        return types.InputFile(
+            id=file_id,
+            parts=parts,
+            name=file_name,
+            md5_checksum=""
+        )
+
+    async def send_file(
+        self,
+        chat_id: Union[int, str],
+        input_file,
+        file_name: str,
+        caption: str = "",
+        video_metadata: dict = None
+    ):
+        """Sends an already uploaded file (InputFile/InputFileBig) as a document or streaming video."""
+        media = await self.input_media(input_file, file_name, video_metadata)
+        return await self.send_media(chat_id, media, caption)
+
+    async def send_media(self, chat_id: Union[int, str], media, caption: str = ""):
+        peer = await get_chat_cache(self.client).resolve_peer(chat_id)
+
+        # Same random_id on every retry, so a send that did go through is not duplicated
+        return await self.invoke_flood_wait(
+            functions.messages.SendMedia(
+                peer=peer,
+                media=media,
+                message=caption or "",
+                random_id=self.client.rnd_id()
             )
+        )
+
+    async def input_media(self, input_file, file_name: str, video_metadata: dict = None):
+        """
+        Builds the InputMediaUploadedDocument of an uploaded file, uploading its thumbnail if any.
+        Photos (video_metadata["is_photo"]) become an InputMediaUploadedPhoto instead.
+        """
+        if video_metadata and video_metadata.get("is_photo"):
+            return types.InputMediaUploadedPhoto(file=input_file)
 
         # Detect if it's a video
         video_extensions = (".mp4", ".mkv", ".mov", ".avi", ".flv", ".wmv", ".webm", ".m4v", ".3gp")
-        is_video = path.lower().endswith(video_extensions)
+        is_video = file_name.lower().endswith(video_extensions)
         mime = "video/mp4" if is_video else "application/octet-stream"
 
         # Extract metadata from video_metadata dict if provided
@@ -109,8 +275,6 @@ class FastUpload:
         input_thumb = None
         if thumb_path and os.path.exists(thumb_path):
             try:
-                thumb_size = os.path.getsize(thumb_path)
-                thumb_chunks = math.ceil(thumb_size / chunk_size)
                 thumb_file_id = random.randint(0, 2**63 - 1)
                 
                 # Upload thumbnail
@@ -138,21 +302,65 @@ class FastUpload:
                 print(f"Thumbnail upload error: {e}")
                 input_thumb = None
 
-        # Finalize using raw invoke
-        peer = await self.client.resolve_peer(chat_id)
-        
-        media = types.InputMediaUploadedDocument(
+        return types.InputMediaUploadedDocument(
             file=input_file,
             mime_type=mime,
             attributes=attributes,
             thumb=input_thumb
         )
 
-        return await self.client.invoke(
-            functions.messages.SendMedia(
-                peer=peer,
-                media=media,
-                message=caption or "",
-                random_id=self.client.rnd_id()
+    async def invoke_flood_wait(self, query):
+        while True:
+            try:
+                return await self.client.invoke(query)
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+
+    async def send_album(self, chat_id: Union[int, str], items: list):
+        """
+        Sends uploaded media as one grouped album. items are (InputMediaUploaded*, caption) pairs from
+        input_media, at most 10. Each file is registered with UploadMedia in parallel, then one
+        SendMultiMedia sends them all. Photos stay photos, so photo + video albums stay grouped.
+        """
+        peer = await get_chat_cache(self.client).resolve_peer(chat_id)
+
+        async def register(media, caption):
+            uploaded = await self.invoke_flood_wait(
+                functions.messages.UploadMedia(peer=peer, media=media)
             )
-        )
+            if isinstance(uploaded, types.MessageMediaPhoto):
+                photo = uploaded.photo
+                registered = types.InputMediaPhoto(
+                    id=types.InputPhoto(
+                        id=photo.id,
+                        access_hash=photo.access_hash,
+                        file_reference=photo.file_reference
+                    )
+                )
+            else:
+                document = uploaded.document
+                registered = types.InputMediaDocument(
+                    id=types.InputDocument(
+                        id=document.id,
+                        access_hash=document.access_hash,
+                        file_reference=document.file_reference
+                    )
+                )
+            return types.InputSingleMedia(
+                media=registered,
+                random_id=self.client.rnd_id(),
+                message=caption or ""
+            )
+
+        multi_media = await asyncio.gather(*(register(media, caption) for media, caption in items))
+        try:
+            return await self.invoke_flood_wait(
+                functions.messages.SendMultiMedia(peer=peer, multi_media=list(multi_media))
+            )
+        except BadRequest as e:
+            # Documents cannot share an album with photos or videos: send the items one by one
+            logger.warning(f"Album send failed ({e}), sending {len(multi_media)} items separately")
+            sent = None
+            for single in multi_media:
+                sent = await self.send_media(chat_id, single.media, single.message)
+            return sent
@@ -0,0 +1,105 @@
+import asyncio
+import math
+import os
+import random
+from typing import Callable, Optional, Union
+from pyrogram.client import Client
+
+from fast_dl.fast_download import FastDownload, release_staging
+from fast_dl.fast_upload import FastUpload, PART_SIZE, BIG_FILE_THRESHOLD, MAX_INFLIGHT_BYTES
+from fast_dl.tuning import MAX_INFLIGHT
+
+class FastRelay:
+    """
+    Streams media from one client to another without touching disk.
+    Downloaded parts go through a bounded in-memory buffer straight into
+    SaveFilePart/SaveBigFilePart calls, so the upload starts with the first part.
+    Parts being fetched, buffered and saved together stay within max_inflight_bytes.
+    """
+
+    def __init__(self, src_client: Client, dst_client: Client, num_workers: int = MAX_INFLIGHT, max_inflight_bytes: int = MAX_INFLIGHT_BYTES):
+        # A third of the budget each for parts being fetched, waiting, and being saved
+        budget_parts = max(3, max_inflight_bytes // PART_SIZE)
+        self.num_workers = max(1, min(num_workers, budget_parts // 3))
+        self.buffer_parts = budget_parts - 2 * self.num_workers
+        # Download with the upload part size so every fetched part maps to one saved part
+        self.downloader = FastDownload(src_client, part_size=PART_SIZE, num_workers=self.num_workers)
+        self.uploader = FastUpload(dst_client, num_workers=self.num_workers, max_inflight_bytes=max_inflight_bytes)
+
+    async def relay(
+        self,
+        message,
+        chat_id: Union[int, str],
+        caption: str = "",
+        progress: Optional[Callable] = None,
+        progress_args: tuple = ()
+    ):
+        input_media = await self.relay_media(message, progress, progress_args)
+        if not input_media:
+            return None
+        return await self.uploader.send_media(chat_id, input_media, caption)
+
+    async def relay_media(self, message, progress: Optional[Callable] = None, progress_args: tuple = ()):
+        """Streams the message's file into the destination client; returns the InputMedia to send it with."""
+        media = getattr(message, message.media.value) if message.media else None
+        if not media:
+            return None
+
+        file_size = getattr(media, "file_size", 0) or 0
+        if not file_size:
+            raise ValueError("Relay needs a known file size")
+
+        # Nothing is staged but the thumbnail, which still needs a path of its own
+        file_path = self.downloader.resolve_path(message, media)
+        file_name = os.path.basename(file_path)
+
+        try:
+            metadata = await self.downloader.fetch_metadata(message, file_path)
+
+            total_parts = math.ceil(file_size / PART_SIZE)
+            is_big = file_size > BIG_FILE_THRESHOLD
+            file_id = random.randint(0, 2**63 - 1)
+
+            buffer = asyncio.Queue(maxsize=self.buffer_parts)
+            uploaded = 0
+            controller = await self.uploader.controller(self.num_workers)
+
+            async def on_part(index, data):
+                await buffer.put((index, data))
+
+            async def produce():
+                await self.downloader.fetch_parts(media, on_part, range(total_parts))
+                for _ in range(self.num_workers):
+                    await buffer.put(None)
+
+            async def consume():
+                nonlocal uploaded
+                while True:
+                    item = await buffer.get()
+                    if item is None:
+                        return
+                    index, data = item
+                    await self.uploader.save_part(file_id, index, total_parts, data, is_big, controller)
+
+                    uploaded += len(data)
+                    if progress:
+                        await progress(uploaded, file_size, *progress_args)
+
+            tasks = [asyncio.create_task(produce())]
+            tasks += [asyncio.create_task(consume()) for _ in range(self.num_workers)]
+
+            # A failure on either side must not leave the other blocked on the buffer
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                controller.finish()
+            for task in done:
+                task.result()
+
+            input_file = self.uploader.input_file(file_id, total_parts, file_name, is_big)
+            return await self.uploader.input_media(input_file, file_name, metadata)
+        finally:
+            release_staging(file_path)
@@ -0,0 +1,90 @@
+import json
+import math
+import os
+import time
+
+# Minimum seconds between sidecar rewrites while a download is running
+SAVE_INTERVAL = 2.0
+
+class ResumeState:
+    """
+    Sidecar record (`<file>.resume`) of which parts of a download are already on disk.
+    Lets a retry or a restarted process fetch only the missing parts.
+    """
+
+    def __init__(self, file_path: str, file_unique_id: str, file_size: int, part_size: int):
+        self.file_path = file_path
+        self.path = f"{file_path}.resume"
+        self.key = {
+            "file_unique_id": file_unique_id,
+            "file_size": file_size,
+            "part_size": part_size
+        }
+        self.file_size = file_size
+        self.part_size = part_size
+        self.num_parts = math.ceil(file_size / part_size)
+        self.bitmap = bytearray((self.num_parts + 7) // 8)
+        self.resumed = False
+        self._dirty = False
+        self._saved_at = 0.0
+
+    @classmethod
+    def load(cls, file_path: str, file_unique_id: str, file_size: int, part_size: int):
+        state = cls(file_path, file_unique_id, file_size, part_size)
+        if not os.path.exists(state.path):
+            return state
+
+        try:
+            with open(state.path, "r") as f:
+                data = json.load(f)
+            bitmap = bytes.fromhex(data.get("bitmap", ""))
+            if (
+                data.get("key") == state.key
+                and len(bitmap) == len(state.bitmap)
+                and os.path.exists(file_path)
+            ):
+                state.bitmap = bytearray(bitmap)
+                state.resumed = True
+        except Exception as e:
+            print(f"Ignoring unreadable resume file {state.path}: {e}")
+
+        if not state.resumed:
+            state.discard()
+        return state
+
+    def is_done(self, index: int) -> bool:
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def mark(self, index: int):
+        self.bitmap[index >> 3] |= 1 << (index & 7)
+        self._dirty = True
+
+    def missing(self):
+        return [i for i in range(self.num_parts) if not self.is_done(i)]
+
+    def done_bytes(self) -> int:
+        done = 0
+        for i in range(self.num_parts):
+            if self.is_done(i):
+                done += min(self.part_size, self.file_size - i * self.part_size)
+        return done
+
+    def due(self) -> bool:
+        """True once new parts were marked and the last save is SAVE_INTERVAL old."""
+        return self._dirty and time.monotonic() - self._saved_at >= SAVE_INTERVAL
+
+    def save(self):
+        """Writes the bitmap atomically. Callers must flush the data file first."""
+        if not self._dirty:
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": self.key, "bitmap": self.bitmap.hex()}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
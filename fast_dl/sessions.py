@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from pyrogram import Client
+from pyrogram.raw import functions
+from pyrogram.session import Session, Auth
+
+# Extra media connections opened per DC. Telegram throttles each connection,
+# so parts are spread across them
+SESSIONS_PER_DC = 4
+# A new connection is opened once every open one already carries this many parts
+PARTS_PER_SESSION = 4
+# Consecutive network failures after which a connection is dropped and replaced
+MAX_FAILURES = 2
+# Sessions idle for longer than this are pinged before they carry parts again
+IDLE_CHECK_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+class _PooledSession:
+    def __init__(self, session: Session):
+        self.session = session
+        self.inflight = 0
+        self.failures = 0
+        self.last_used = time.monotonic()
+
+class MediaSessionPool:
+    """
+    Authorized media sessions of one client, grouped by DC.
+    Requests go to the least loaded session; broken sessions are stopped and replaced.
+    """
+
+    def __init__(self, client: Client, size: int = SESSIONS_PER_DC):
+        self.client = client
+        self.size = max(1, size)
+        self._sessions = {}  # dc_id -> [_PooledSession]
+        self._auth_keys = {}  # dc_id -> auth key shared by that DC's sessions
+        self._locks = {}  # dc_id -> asyncio.Lock
+
+    async def _auth_key(self, dc_id: int, test_mode: bool, home_dc: int):
+        if dc_id == home_dc:
+            return await self.client.storage.auth_key(), False
+        if dc_id not in self._auth_keys:
+            self._auth_keys[dc_id] = await Auth(self.client, dc_id, test_mode).create()
+            return self._auth_keys[dc_id], True
+        return self._auth_keys[dc_id], False
+
+    async def _create(self, dc_id: int) -> _PooledSession:
+        test_mode = await self.client.storage.test_mode()
+        home_dc = await self.client.storage.dc_id()
+        auth_key, needs_import = await self._auth_key(dc_id, test_mode, home_dc)
+
+        session = Session(self.client, dc_id, auth_key, test_mode, is_media=True)
+        await session.start()
+
+        # The exported authorization is bound to the auth key, so it is imported once per DC
+        if needs_import:
+            try:
+                exported = await self.client.invoke(
+                    functions.auth.ExportAuthorization(dc_id=dc_id)
+                )
+                await session.invoke(
+                    functions.auth.ImportAuthorization(
+                        id=exported.id,
+                        bytes=exported.bytes
+                    )
+                )
+            except Exception:
+                del self._auth_keys[dc_id]
+                await session.stop()
+                raise
+
+        return _PooledSession(session)
+
+    async def _healthy(self, pooled: _PooledSession) -> bool:
+        if time.monotonic() - pooled.last_used < IDLE_CHECK_SECONDS:
+            return True
+        try:
+            await pooled.session.invoke(functions.Ping(ping_id=0), retries=1, timeout=5)
+            pooled.last_used = time.monotonic()
+            return True
+        except Exception:
+            return False
+
+    async def _acquire(self, dc_id: int) -> _PooledSession:
+        sessions = self._sessions.setdefault(dc_id, [])
+        lock = self._locks.setdefault(dc_id, asyncio.Lock())
+
+        while True:
+            idlest = min(sessions, key=lambda s: s.inflight) if sessions else None
+            if idlest is None or (idlest.inflight >= PARTS_PER_SESSION and len(sessions) < self.size):
+                async with lock:
+                    # Another request may have opened one while we waited
+                    if not sessions or (len(sessions) < self.size and min(s.inflight for s in sessions) >= PARTS_PER_SESSION):
+                        try:
+                            sessions.append(await self._create(dc_id))
+                        except Exception as e:
+                            if not sessions:
+                                raise
+                            logger.warning(f"Could not open extra media session to DC{dc_id}: {e}")
+
+            pooled = min(sessions, key=lambda s: s.inflight)
+            pooled.inflight += 1
+            if await self._healthy(pooled):
+                return pooled
+            pooled.inflight -= 1
+            await self._drop(dc_id, pooled)
+
+    async def _drop(self, dc_id: int, pooled: _PooledSession):
+        sessions = self._sessions.get(dc_id, [])
+        if pooled in sessions:
+            sessions.remove(pooled)
+            logger.warning(f"Replacing unhealthy media session to DC{dc_id}")
+            try:
+                await pooled.session.stop()
+            except Exception:
+                pass
+
+    async def invoke(self, dc_id: int, query, attempts: int = 2):
+        """Invokes `query` on a session to `dc_id`, moving to another one on network errors."""
+        for attempt in range(1, attempts + 1):
+            pooled = await self._acquire(dc_id)
+            try:
+                result = await pooled.session.invoke(query)
+            except (OSError, asyncio.TimeoutError):
+                pooled.failures += 1
+                if pooled.failures >= MAX_FAILURES:
+                    await self._drop(dc_id, pooled)
+                if attempt == attempts:
+                    raise
+                continue
+            finally:
+                pooled.inflight -= 1
+
+            pooled.failures = 0
+            pooled.last_used = time.monotonic()
+            return result
+
+    async def close(self):
+        sessions = [s for group in self._sessions.values() for s in group]
+        self._sessions.clear()
+        self._auth_keys.clear()
+        for pooled in sessions:
+            try:
+                await pooled.session.stop()
+            except Exception:
+                pass
+
+_pools = {}
+
+def get_session_pool(client: Client) -> MediaSessionPool:
+    """Returns the media session pool of `client`, creating it on first use."""
+    pool = _pools.get(client)
+    if pool is None:
+        pool = _pools[client] = MediaSessionPool(client)
+    return pool
+
+async def close_session_pool(client: Client):
+    """Stops the extra media sessions of `client`. Call before the client itself stops."""
+    pool = _pools.pop(client, None)
+    if pool:
+        await pool.close()
@@ -0,0 +1,100 @@
+import asyncio
+import collections
+import time
+
+# In-flight part limits. Part sizes stay at the MTProto maxima (1MB GetFile,
+# 512KB SaveBigFilePart): bigger parts only lower the per-request overhead.
+MIN_INFLIGHT = 2
+DEFAULT_INFLIGHT = 8
+MAX_INFLIGHT = 16
+
+# Throughput is measured over windows of this many seconds
+WINDOW_SECONDS = 2.0
+# Average RTT this many times the best one means parts are queueing, not flowing
+RTT_INFLATION = 3.0
+
+# Best limit seen per (direction, dc_id), used as the start point of the next transfer
+_best_limits = {}
+
+class AdaptiveController:
+    """
+    Tunes how many parts a transfer keeps in flight against one DC.
+    Grows the limit by one per window while the link keeps up, shrinks it when
+    throughput drops or RTT inflates, and halves it on FloodWait.
+    """
+
+    def __init__(self, direction: str, dc_id: int, max_limit: int = MAX_INFLIGHT, min_limit: int = MIN_INFLIGHT):
+        self.key = (direction, dc_id)
+        self.max_limit = max(1, max_limit)
+        self.min_limit = min(min_limit, self.max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, _best_limits.get(self.key, DEFAULT_INFLIGHT)))
+        self.inflight = 0
+        self._waiters = collections.deque()
+
+        self._best_rate = 0.0
+        self._best_limit = self.limit
+        self._last_rate = 0.0
+        self._min_rtt = float("inf")
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._rtt_sum = 0.0
+        self._rtt_count = 0
+        self._peak = self.inflight
+
+    async def acquire(self) -> float:
+        """Waits for a free slot; returns the start time to hand back to release()."""
+        while self.inflight >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self.inflight += 1
+        self._peak = max(self._peak, self.inflight)
+        return time.monotonic()
+
+    def release(self, started: float, nbytes: int = 0):
+        """Frees a slot. Pass the part size for successful requests so they are measured."""
+        self.inflight -= 1
+        if nbytes:
+            self._record(nbytes, time.monotonic() - started)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def flood_wait(self):
+        self.limit = max(self.min_limit, self.limit // 2)
+        self._best_limit = min(self._best_limit, self.limit)
+
+    def _record(self, nbytes: int, rtt: float):
+        self._window_bytes += nbytes
+        self._rtt_sum += rtt
+        self._rtt_count += 1
+        self._min_rtt = min(self._min_rtt, rtt)
+
+        elapsed = time.monotonic() - self._window_start
+        if elapsed < WINDOW_SECONDS:
+            return
+
+        rate = self._window_bytes / elapsed
+        avg_rtt = self._rtt_sum / self._rtt_count
+        if rate > self._best_rate:
+            self._best_rate = rate
+            self._best_limit = self.limit
+
+        if self._last_rate and rate < self._last_rate * 0.85:
+            self.limit = max(self.min_limit, self.limit - 1)
+        elif avg_rtt > self._min_rtt * RTT_INFLATION:
+            self.limit = max(self.min_limit, self.limit - 1)
+        elif self._peak >= self.limit:
+            # Only grow when the current limit was actually used
+            self.limit = min(self.max_limit, self.limit + 1)
+
+        self._last_rate = rate
+        self._reset_window()
+
+    def finish(self):
+        """Remembers the best limit of this transfer for the next one on the same DC."""
+        _best_limits[self.key] = self._best_limit
@@ -0,0 +1,120 @@
+import asyncio
+import errno
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# Small dedicated pool so disk writes never queue behind the default executor
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="fast_dl_io")
+
+# Adjacent parts are merged until a run reaches this size
+COALESCE_BYTES = 4 * 1024 * 1024  # 4MB
+# Upper bound on bytes held back waiting for a neighbour
+MAX_BUFFERED_BYTES = 16 * 1024 * 1024  # 16MB
+
+class PositionalWriter:
+    """
+    Writes parts into a preallocated file by offset (pwrite-style), in any order.
+    Adjacent parts are coalesced into one pwritev call on IO_EXECUTOR.
+    `on_written(offset, size)` is called once a run has reached the file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_size: int,
+        on_written: Optional[Callable] = None,
+        coalesce_bytes: int = COALESCE_BYTES,
+        max_buffered: int = MAX_BUFFERED_BYTES
+    ):
+        self.path = path
+        self.file_size = file_size
+        self.on_written = on_written
+        self.coalesce_bytes = coalesce_bytes
+        self.max_buffered = max_buffered
+        self.fd = None
+        self._runs = {}  # start offset -> (chunks, size)
+        self._run_starts = {}  # end offset -> start offset
+        self._buffered = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, func, *args)
+
+    def _open(self, keep_existing: bool):
+        flags = os.O_WRONLY | os.O_CREAT
+        if not keep_existing:
+            flags |= os.O_TRUNC
+        fd = os.open(self.path, flags, 0o644)
+        try:
+            try:
+                os.posix_fallocate(fd, 0, self.file_size)
+            except AttributeError:
+                # Not available on every platform; a sparse file still works
+                os.ftruncate(fd, self.file_size)
+            except OSError as e:
+                # Unsupported by the filesystem is fine; a full disk (ENOSPC) must fail now
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                os.ftruncate(fd, self.file_size)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    async def open(self, keep_existing: bool = False):
+        """Creates (or reopens, when resuming) the file at its final size."""
+        self.fd = await self._run(self._open, keep_existing)
+
+    def _pwrite(self, offset: int, chunks: list, size: int):
+        written = os.pwritev(self.fd, chunks, offset) if hasattr(os, "pwritev") else 0
+        if written < size:
+            view = memoryview(b"".join(chunks))
+            while written < size:
+                written += os.pwrite(self.fd, view[written:], offset + written)
+
+    async def _flush_run(self, start: int):
+        chunks, size = self._runs.pop(start)
+        del self._run_starts[start + size]
+        self._buffered -= size
+
+        await self._run(self._pwrite, start, chunks, size)
+        if self.on_written:
+            self.on_written(start, size)
+
+    async def write(self, offset: int, data: bytes):
+        start, chunks, size = offset, [data], len(data)
+
+        # Merge with a run that ends where this part starts...
+        prev_start = self._run_starts.pop(offset, None)
+        if prev_start is not None:
+            prev_chunks, prev_size = self._runs.pop(prev_start)
+            start, chunks, size = prev_start, prev_chunks + chunks, prev_size + size
+
+        # ...and with a run that starts where this part ends
+        next_run = self._runs.pop(offset + len(data), None)
+        if next_run is not None:
+            next_chunks, next_size = next_run
+            del self._run_starts[offset + len(data) + next_size]
+            chunks, size = chunks + next_chunks, size + next_size
+
+        self._runs[start] = (chunks, size)
+        self._run_starts[start + size] = start
+        self._buffered += len(data)
+
+        if size >= self.coalesce_bytes:
+            await self._flush_run(start)
+        elif self._buffered > self.max_buffered:
+            await self.flush()
+
+    async def flush(self):
+        for start in list(self._runs):
+            if start in self._runs:
+                await self._flush_run(start)
+
+    async def close(self):
+        try:
+            await self.flush()
+        finally:
+            if self.fd is not None:
+                await self._run(os.close, self.fd)
+                self.fd = None
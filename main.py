@@ -45,6 +45,10 @@ if __name__ == "__main__":
     print("Initializing database...")
     init_db()
 
+    # Partial downloads a crash left behind still hold their preallocated space
+    from fast_dl.fast_download import sweep_staging, sweep_staging_loop
+    sweep_staging()
+
     # Check for TgCrypto and debug crypto speed
     try:
         import tgcrypto
@@ -63,11 +67,21 @@ if __name__ == "__main__":
         start_health_check()
         
     asyncio.get_event_loop().create_task(cleanup_expired_logins())
+    from bot.user_clients import reap_idle_user_clients
+    from bot.peer_store import attach_peer_store, flush_peers_loop
+    asyncio.get_event_loop().create_task(flush_peers_loop())
+    asyncio.get_event_loop().create_task(reap_idle_user_clients())
+    from bot.database import flush_usage_loop
+    asyncio.get_event_loop().create_task(flush_usage_loop())
+    asyncio.get_event_loop().create_task(sweep_staging_loop())
     from bot.logger import cleanup_loop
     asyncio.get_event_loop().create_task(cleanup_loop())
     asyncio.get_event_loop().create_task(periodic_cloud_backup(interval_minutes=10))
     print("Starting bot...")
     if app:
+        # Peers seen before a restart are resolved from the database instead of Telegram
+        attach_peer_store(app)
+
         # Check DC while running
         async def check_dc_later():
             await asyncio.sleep(5)